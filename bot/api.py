@@ -1,21 +1,68 @@
 import logging
-from datetime import date, datetime
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session
-from typing import List, Optional
-from database import get_session
-from models import ScrapeRequest, ScrapeStatusResponse, Channel, AnalyticsResponse, Message
-from repository import TelegramRepository
-from service import TelegramService, SCRAPE_STATUS
+import uuid
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response, Query
+from fastapi.responses import ORJSONResponse
+from typing import Dict, List, Optional, Sequence
+from database import get_session, get_read_session
+from models import ScrapeRequest, ScrapeStatusResponse, Channel, AnalyticsResponse, Message, Post
+from models import MessageGrowthResponse, ChannelGrowthResponse, BulkScrapeRequest, BulkScrapeResponse
+from models import TopPostsResponse, ChannelComparisonResponse, SubscriberGrowthResponse
+from repository import TelegramRepository, METRIC_FIELDS
+from service import TelegramService, SCRAPE_STATUS, BULK_STATUS
 import telegram_client 
+import metrics
+from channel_cache import CHANNEL_CACHE, normalize_identifier, is_valid_identifier
 
 logger = logging.getLogger(__name__)
 
+# Response shapes: "rows" is a list of objects, "columns" one array per field
+SHAPE_QUERY = Query(default="rows", pattern="^(rows|columns)$")
+BREAKDOWN_FIELDS = ("date", "posts", "views", "reactions", "replies", "forwards")
+MESSAGE_FIELDS = ("id", "channel_id", "message_id", "date", "media_group_id") + METRIC_FIELDS
+
+
+def _columnar(rows: Sequence, fields: Sequence[str]) -> Dict[str, list]:
+    """Transposes rows (dicts or objects) into {field: [values...]}; field names are sent once."""
+    if rows and isinstance(rows[0], dict):
+        return {field: [row[field] for row in rows] for field in fields}
+    return {field: [getattr(row, field) for row in rows] for field in fields}
+
 router = APIRouter()
 
+# Read-only GET routes that may be served by a read replica (see database.get_read_session)
+REPLICA_ROUTES = ("/api/analytics", "/api/messages", "/api/channels")
+
+
+def _staleness_keys(request: Request, route_path: str) -> List[Optional[int]]:
+    # /api/channels/{channel_id} is the internal id: guard on channel table writes only
+    if route_path.startswith("/api/channels"):
+        return [None]
+    raw = [request.path_params.get("channel_id"), request.query_params.get("channel_id")]
+    raw += request.query_params.getlist("channel_ids")
+    keys: List[Optional[int]] = []
+    for value in raw:
+        try:
+            keys.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    # No channel in the request (e.g. comparing all channels): guard on channel table writes
+    return keys or [None]
+
+
 # Dependency to get Repository
-def get_repository(session: Session = Depends(get_session)):
-    return TelegramRepository(session)
+def get_repository(request: Request):
+    """
+    Replica-eligible GETs read from a replica unless one of their channels was
+    written moments ago; everything else uses the primary.
+    """
+    route_path = getattr(request.scope.get("route"), "path", request.url.path)
+    if request.method == "GET" and route_path.startswith(REPLICA_ROUTES):
+        sessions = get_read_session(_staleness_keys(request, route_path))
+    else:
+        sessions = get_session()
+    for session in sessions:
+        yield TelegramRepository(session)
 
 # Dependency to get Service - MUST ENSURE CLIENT IS CONNECTED
 def get_telegram_service():
@@ -24,10 +71,12 @@ def get_telegram_service():
     
     # Check if the client is None 
     if client_instance is None:
-        logger.error("Pyrogram client is None. Client initialization failed in main.")
+        # Not connected yet (still starting in the background) or disabled
+        logger.warning("Pyrogram client is not ready yet.")
         raise HTTPException(
             status_code=503, 
-            detail="Scraper service is unavailable. Telegram client is not initialized."
+            detail="Scraper service is unavailable. Telegram client is not connected yet.",
+            headers={"Retry-After": "5"}
         )
 
     # Use is_connected on the retrieved instance
@@ -62,7 +111,9 @@ async def start_scrape(
         service.scrape_channel_task,
         request.channel_identifier,
         request.start_date,
-        end_dt
+        end_dt,
+        request.shards,
+        request.resume
     )
     
     return {
@@ -71,21 +122,31 @@ async def start_scrape(
         "messages_processed": 0
     }
 
+def _status_payload(identifier: str, data: dict) -> dict:
+    return {
+        "channel_identifier": identifier,
+        "status": data.get("status"),
+        "messages_processed": data.get("messages_processed", 0),
+        "current_message_date": data.get("current_message_date"),
+        "error": data.get("error"),
+        "rows_inserted": data.get("rows_inserted", 0),
+        "rows_updated": data.get("rows_updated", 0),
+        "rows_unchanged": data.get("rows_unchanged", 0),
+        "shards": data.get("shards"),
+        "messages_per_second": data.get("messages_per_second"),
+        "progress": data.get("progress"),
+        "eta_seconds": data.get("eta_seconds"),
+        "elapsed_seconds": data.get("elapsed_seconds"),
+        "flood_wait_seconds": data.get("flood_wait_seconds"),
+        "db_flush_seconds": data.get("db_flush_seconds")
+    }
+
 @router.get("/api/scrape_status", response_model=List[ScrapeStatusResponse])
 async def get_scrape_status():
     """
     Returns the live status of all tracked scraping tasks.
     """
-    results = []
-    for identifier, data in SCRAPE_STATUS.items():
-        results.append({
-            "channel_identifier": identifier,
-            "status": data.get("status"),
-            "messages_processed": data.get("messages_processed", 0),
-            "current_message_date": data.get("current_message_date"),
-            "error": data.get("error")
-        })
-    return results
+    return [_status_payload(identifier, data) for identifier, data in SCRAPE_STATUS.items()]
 
 @router.get("/api/scrape_status/{channel_identifier}", response_model=ScrapeStatusResponse)
 async def get_scrape_status_by_id(channel_identifier: str):
@@ -100,13 +161,79 @@ async def get_scrape_status_by_id(channel_identifier: str):
             detail=f"No active or tracked scrape task found for channel: {channel_identifier}"
         )
         
+    return _status_payload(channel_identifier, data)
+
+def _batch_payload(batch_id: str, batch: dict) -> dict:
+    channels = [
+        _status_payload(identifier, SCRAPE_STATUS.get(identifier, {"status": "pending"}))
+        for identifier in batch["channels"]
+    ]
+    counts = {"pending": 0, "running": 0, "completed": 0, "failed": 0}
+    for channel in channels:
+        state = channel["status"] if channel["status"] in counts else "running"
+        counts[state] += 1
+
     return {
-        "channel_identifier": channel_identifier,
-        "status": data.get("status"),
-        "messages_processed": data.get("messages_processed", 0),
-        "current_message_date": data.get("current_message_date"),
-        "error": data.get("error")
+        "batch_id": batch_id,
+        "status": batch["status"],
+        "total": batch["total"],
+        "duplicates": batch["duplicates"],
+        "invalid": batch["invalid"],
+        "unresolved": batch["unresolved"],
+        "messages_processed": sum(c["messages_processed"] for c in channels),
+        "channels": channels,
+        **counts
+    }
+
+@router.post("/api/scrape_channels/bulk", response_model=BulkScrapeResponse)
+async def start_bulk_scrape(
+    request: BulkScrapeRequest,
+    background_tasks: BackgroundTasks,
+    service: TelegramService = Depends(get_telegram_service)
+):
+    """
+    Queue many channels at once with a shared date range.
+    Identifiers are validated and de-duplicated here; resolution and scraping
+    run in the background under the batch concurrency limit.
+    """
+    invalid = [raw for raw in request.channel_identifiers if not is_valid_identifier(raw)]
+    valid = [normalize_identifier(raw) for raw in request.channel_identifiers if is_valid_identifier(raw)]
+    unique = list(dict.fromkeys(valid))
+
+    if not unique:
+        raise HTTPException(status_code=400, detail="No valid channel identifiers in request")
+
+    batch_id = uuid.uuid4().hex
+    BULK_STATUS[batch_id] = {
+        "status": "resolving",
+        "total": len(unique),
+        "duplicates": len(valid) - len(unique),
+        "invalid": invalid,
+        "unresolved": {},
+        "channels": [],
     }
+    logger.info(f"Starting bulk scrape {batch_id} for {len(unique)} channels")
+
+    background_tasks.add_task(
+        service.bulk_scrape_task,
+        batch_id,
+        unique,
+        request.start_date,
+        request.end_date if request.end_date else date.today(),
+        request.shards,
+        request.concurrency
+    )
+    return _batch_payload(batch_id, BULK_STATUS[batch_id])
+
+@router.get("/api/scrape_batches/{batch_id}", response_model=BulkScrapeResponse)
+async def get_bulk_scrape_status(batch_id: str):
+    """
+    Aggregate progress of a bulk scrape.
+    """
+    batch = BULK_STATUS.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No bulk scrape found with id: {batch_id}")
+    return _batch_payload(batch_id, batch)
 
 @router.get("/api/channels", response_model=List[Channel])
 def list_channels(repo: TelegramRepository = Depends(get_repository)):
@@ -122,11 +249,35 @@ def get_channel_details(channel_id: int, repo: TelegramRepository = Depends(get_
         raise HTTPException(status_code=404, detail="Channel not found")
     return channel
 
+@router.get("/api/analytics/compare", response_model=ChannelComparisonResponse)
+def compare_channels(
+    start_date: date,
+    end_date: date,
+    channel_ids: Optional[List[int]] = Query(default=None),
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Portfolio comparison across channels (Telegram ids; omit to compare all).
+    Growth is measured against the preceding period of the same length.
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    period_days = (end_date - start_date).days + 1
+    return ChannelComparisonResponse(
+        period_start=start_date,
+        period_end=end_date,
+        previous_period_start=start_date - timedelta(days=period_days),
+        previous_period_end=start_date - timedelta(days=1),
+        channels=repo.get_channel_comparison(channel_ids, start_date, end_date)
+    )
+
 @router.get("/api/analytics", response_model=AnalyticsResponse)
 def get_analytics(
     channel_id: int,
     start_date: date,
     end_date: date,
+    shape: str = SHAPE_QUERY,
     repo: TelegramRepository = Depends(get_repository)
 ):
     # Fetch analytics data from repository
@@ -135,6 +286,11 @@ def get_analytics(
     if not analytics or not analytics.get("daily_breakdown"):
         raise HTTPException(status_code=404, detail="No analytics data found for this period")
     
+    if shape == "columns":
+        # Skips response model validation; the breakdown becomes one array per field
+        analytics["daily_breakdown"] = _columnar(analytics["daily_breakdown"], BREAKDOWN_FIELDS)
+        return ORJSONResponse(analytics)
+
     # Map repo result to AnalyticsResponse
     return AnalyticsResponse(
         channel_id=analytics["channel_id"],
@@ -148,17 +304,46 @@ def get_analytics(
         daily_breakdown=analytics["daily_breakdown"]
     )
 
+@router.get("/api/top_posts", response_model=TopPostsResponse)
+def get_top_posts(
+    channel_id: int,
+    start_date: date,
+    end_date: date,
+    metric: str = "views",
+    limit: int = Query(default=10, ge=1, le=100),
+    group_media: bool = True,
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Top N posts of a channel by views, reactions, replies, forwards or
+    engagement rate ((reactions + replies + forwards) / views).
+    Albums count as one post unless group_media is false.
+    """
+    if metric not in METRIC_FIELDS + ("engagement_rate",):
+        raise HTTPException(status_code=400, detail=f"Unsupported metric: {metric}")
+
+    posts = repo.get_top_posts(channel_id, start_date, end_date, metric, limit, group_media)
+    return TopPostsResponse(
+        channel_id=channel_id,
+        period_start=start_date,
+        period_end=end_date,
+        metric=metric,
+        posts=posts
+    )
+
 @router.get("/api/messages/{channel_id}", response_model=List[Message])
 def get_channel_messages(
     channel_id: int, 
     limit: int = 100, 
     offset: int = 0, 
+    shape: str = SHAPE_QUERY,
     repo: TelegramRepository = Depends(get_repository)
 ):
     """
     Get raw messages for a specific channel.
     Uses pagination (limit/offset) to prevent server overload.
     To get all, you can loop through pages or set a high limit.
+    shape=columns returns {field: [values...]} instead of a list of objects.
     """
     # Note: channel_id here should be the Telegram ID (e.g., -100...) 
     # If you meant the internal DB ID, you might need to look up the channel first.
@@ -169,9 +354,88 @@ def get_channel_messages(
          # Optional: Only raise 404 if it's the first page and empty
          # otherwise an empty list is a valid response for "end of pagination"
          raise HTTPException(status_code=404, detail="No messages found for this channel.")
-         
+
+    if shape == "columns":
+        return ORJSONResponse(_columnar(messages, MESSAGE_FIELDS))
     return messages
 
+@router.get("/api/messages/{channel_id}/{message_id}/growth", response_model=MessageGrowthResponse)
+def get_message_growth(
+    channel_id: int,
+    message_id: int,
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Cumulative views/reactions/replies/forwards of one post at every scrape where they changed.
+    """
+    points = repo.get_message_growth(channel_id, message_id)
+    if not points:
+        raise HTTPException(status_code=404, detail="No snapshots found for this message.")
+    return MessageGrowthResponse(channel_id=channel_id, message_id=message_id, points=points)
+
+@router.get("/api/growth/{channel_id}", response_model=ChannelGrowthResponse)
+def get_channel_growth(
+    channel_id: int,
+    start_date: date,
+    end_date: date,
+    bucket: str = "day",
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Metrics gained per hour or day across all posts of a channel.
+    """
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be 'hour' or 'day'")
+
+    points = repo.get_channel_growth(channel_id, start_date, end_date, bucket)
+    return ChannelGrowthResponse(
+        channel_id=channel_id,
+        period_start=start_date,
+        period_end=end_date,
+        bucket=bucket,
+        points=points
+    )
+
+@router.get("/api/subscribers/{channel_id}", response_model=SubscriberGrowthResponse)
+def get_subscriber_growth(
+    channel_id: int,
+    start_date: date,
+    end_date: date,
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Daily subscriber counts of a channel and the net growth over the range.
+    """
+    points = repo.get_subscriber_history(channel_id, start_date, end_date)
+    start_count = points[0]["subscribers"] if points else None
+    end_count = points[-1]["subscribers"] if points else None
+    change = end_count - start_count if points else None
+    return SubscriberGrowthResponse(
+        channel_id=channel_id,
+        period_start=start_date,
+        period_end=end_date,
+        start_count=start_count,
+        end_count=end_count,
+        change=change,
+        change_pct=round(change / start_count * 100, 2) if start_count else None,
+        points=points
+    )
+
+@router.get("/api/posts/{channel_id}", response_model=List[Post])
+def get_channel_posts(
+    channel_id: int,
+    limit: int = 100,
+    offset: int = 0,
+    repo: TelegramRepository = Depends(get_repository)
+):
+    """
+    Logical posts of a channel (albums collapsed into one row), paginated like /api/messages.
+    """
+    posts = repo.get_posts_by_channel(channel_id, limit, offset)
+    if not posts and offset == 0:
+        raise HTTPException(status_code=404, detail="No posts found for this channel.")
+    return posts
+
 @router.delete("/api/channels/{channel_id}")
 def delete_channel(
     channel_id: int,
@@ -185,9 +449,11 @@ def delete_channel(
         raise HTTPException(status_code=404, detail="Channel not found")
     
     # Delete channel (cascade should handle messages)
+    telegram_id = channel.channel_id
     success = repo.delete_channel(channel_id)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete channel")
+    CHANNEL_CACHE.invalidate(telegram_id)
     
     return {"message": "Channel deleted successfully", "channel_id": channel_id}
 
@@ -235,4 +501,12 @@ def check_duplicates(
             {"channel_id": d[0], "message_id": d[1], "count": d[2]} 
             for d in duplicates
         ]
-    }
\ No newline at end of file
+    }
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,81 @@
+import os
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from models import Channel, ChannelData
+
+# --- CHANNEL METADATA CACHE CONFIGURATION ---
+CHANNEL_CACHE_TTL_SECONDS = int(os.getenv("CHANNEL_CACHE_TTL_SECONDS", 6 * 3600))
+
+CHANNEL_FIELDS = ("channel_id", "title", "username", "description", "photo_file_id",
+                  "subscriber_count", "type", "linked_chat_id")
+
+_LINK_PREFIX = re.compile(r"^(https?://)?(www\.)?(t\.me|telegram\.me)/", re.IGNORECASE)
+_USERNAME = re.compile(r"^[a-z][a-z0-9_]{3,31}$")
+
+
+def normalize_identifier(identifier: str) -> str:
+    """
+    Canonical form of a channel identifier: '@Name', 't.me/name' and 'name' all map to 'name'.
+    Numeric ids are kept as-is.
+    """
+    value = _LINK_PREFIX.sub("", str(identifier).strip()).strip("/").lstrip("@")
+    return value if value.lstrip("-").isdigit() else value.lower()
+
+
+def is_valid_identifier(identifier: str) -> bool:
+    """Accepts Telegram usernames and numeric chat ids (after normalization)."""
+    value = normalize_identifier(identifier)
+    return value.lstrip("-").isdigit() or bool(_USERNAME.match(value))
+
+
+def channel_to_data(channel: Channel) -> ChannelData:
+    return {field: getattr(channel, field) for field in CHANNEL_FIELDS}
+
+
+class ChannelCache:
+    """
+    In-process TTL cache of resolved identifiers and channel metadata.
+
+    A fresh entry lets a scrape skip both get_chat and the channel upsert.
+    """
+
+    def __init__(self, ttl_seconds: int = CHANNEL_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._ids: Dict[str, int] = {}                             # normalized identifier -> channel_id
+        self._meta: Dict[int, Tuple[ChannelData, float]] = {}      # channel_id -> (data, expires_at)
+
+    def get(self, identifier: str) -> Optional[ChannelData]:
+        channel_id = self._ids.get(normalize_identifier(identifier))
+        if channel_id is None:
+            return None
+        entry = self._meta.get(channel_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def get_channel_id(self, identifier: str) -> Optional[int]:
+        # Identifier resolution never changes, so it survives metadata expiry
+        return self._ids.get(normalize_identifier(identifier))
+
+    def store(self, identifier: Optional[str], channel_data: ChannelData):
+        channel_id = channel_data["channel_id"]
+        if identifier is not None:
+            self._ids[normalize_identifier(identifier)] = channel_id
+        self._ids[str(channel_id)] = channel_id
+        if channel_data.get("username"):
+            self._ids[normalize_identifier(channel_data["username"])] = channel_id
+        self._meta[channel_id] = (dict(channel_data), time.monotonic() + self.ttl_seconds)
+
+    def is_unchanged(self, channel_data: ChannelData) -> bool:
+        entry = self._meta.get(channel_data["channel_id"])
+        return entry is not None and entry[0] == channel_data
+
+    def invalidate(self, channel_id: int):
+        self._meta.pop(channel_id, None)
+        for key in [k for k, v in self._ids.items() if v == channel_id]:
+            del self._ids[key]
+
+
+CHANNEL_CACHE = ChannelCache()
@@ -1,10 +1,22 @@
 import os
-from typing import Generator
+import time
+import hashlib
+import logging
+import itertools
+from datetime import datetime
+from typing import Dict, Generator, Iterable, Optional
 from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlmodel import create_engine, Session
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# "auto" skips create_all/index checks when the stored schema version matches; "always" forces them
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "auto").lower()
+
 # --- CONFIGURATION ---
 def get_db_url():
     user = os.getenv('DB_USER')
@@ -26,10 +38,97 @@ DATABASE_URL = get_db_url()
 # Create Engine
 engine = create_engine(DATABASE_URL, echo=False)
 
+# --- READ REPLICAS ---
+# Comma-separated DSNs; read-only endpoints are spread across them round-robin
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("DB_REPLICA_DSNS", "").split(",") if dsn.strip()]
+# Reads of a channel written within this window go to the primary (replica lag guard)
+REPLICA_STALENESS_SECONDS = float(os.getenv("REPLICA_STALENESS_SECONDS", 5))
+
+replica_engines = [create_engine(dsn, echo=False, pool_pre_ping=True) for dsn in DB_REPLICA_DSNS]
+_replica_cycle = itertools.cycle(replica_engines)
+# channel_id (None = the channels table) -> monotonic time of the last write on the primary
+_last_write: Dict[Optional[int], float] = {}
+
 def create_db_and_tables():
-    from models import SQLModel # Import here to ensure models are registered
+    from models import SQLModel, SchemaVersion # Import here to ensure models are registered
+    version = schema_fingerprint(SQLModel.metadata)
+    if SCHEMA_CHECK != "always" and get_schema_version() == version:
+        logger.info(f"Schema version {version} is current, skipping schema checks")
+        return
+
     SQLModel.metadata.create_all(engine)
+    ensure_columns(SQLModel.metadata)
+    ensure_indexes(SQLModel.metadata)
+    with Session(engine) as session:
+        session.merge(SchemaVersion(id=1, version=version, applied_at=datetime.utcnow()))
+        session.commit()
+    logger.info(f"Schema version {version} applied")
+
+def schema_fingerprint(metadata) -> str:
+    # Changes whenever a table, column or index is added, removed or retyped in models.py
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type}:{c.nullable}:{c.primary_key}" for c in table.columns)
+        parts.extend(sorted(f"index:{i.name}:{[c.name for c in i.columns]}" for i in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+def get_schema_version() -> Optional[str]:
+    from models import SchemaVersion
+    try:
+        with Session(engine) as session:
+            row = session.get(SchemaVersion, 1)
+            return row.version if row else None
+    except SQLAlchemyError:
+        # Fresh database: the table does not exist yet
+        return None
+
+def ensure_columns(metadata):
+    # create_all skips tables that already exist, so nullable columns added later are added here
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"
+                ))
+                logger.info(f"Added column {table.name}.{column.name}")
+
+def ensure_indexes(metadata):
+    # create_all skips tables that already exist, so indexes added later are created here
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def mark_written(channel_id: Optional[int] = None):
+    """Records a primary write so reads of this channel skip replicas for a while."""
+    _last_write[channel_id] = time.monotonic()
+
+def recently_written(keys: Iterable[Optional[int]]) -> bool:
+    cutoff = time.monotonic() - REPLICA_STALENESS_SECONDS
+    return any(_last_write.get(key, 0.0) > cutoff for key in keys)
+
+def get_read_session(keys: Iterable[Optional[int]] = (None,)) -> Generator[Session, None, None]:
+    """
+    Session on the next read replica, or on the primary when no replica is
+    configured or one of the keys (channel ids) was written moments ago.
+    """
+    target = engine
+    if replica_engines and not recently_written(keys):
+        target = next(_replica_cycle)
+    with Session(target) as session:
+        yield session
@@ -0,0 +1,180 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+
+from pyrogram.enums import ChatType
+from pyrogram.errors import FloodWait
+
+from ratelimit import HISTORY_PAGE_SIZE
+
+
+class FakeClient:
+    """
+    In-process stand-in for a Pyrogram Client serving synthetic channels.
+
+    Implements the subset of the Client API used by TelegramService
+    (get_chat, get_chat_history, get_discussion_replies_count) with
+    configurable history size, per-RPC latency, FloodWait injection,
+    media groups and reactions. Histories are generated from a seed, so
+    runs are reproducible.
+
+    FloodWaits shorter than sleep_threshold are slept through inside the
+    client, like Pyrogram does; longer ones are raised to the caller.
+    With fail_after_pages set, the history page after that many raises a
+    ConnectionError once, to interrupt a scrape mid-walk.
+    """
+
+    def __init__(
+        self,
+        history_size: int = 5000,
+        days: int = 365,
+        latency: float = 0.0,
+        flood_wait_every: int = 0,
+        flood_wait_seconds: int = 1,
+        sleep_threshold: int = 10,
+        media_group_ratio: float = 0.2,
+        reactions: bool = True,
+        fail_after_pages: int = 0,
+        seed: int = 42
+    ):
+        self.history_size = history_size
+        self.days = days
+        self.latency = latency
+        self.flood_wait_every = flood_wait_every
+        self.flood_wait_seconds = flood_wait_seconds
+        self.sleep_threshold = sleep_threshold
+        self.media_group_ratio = media_group_ratio
+        self.reactions = reactions
+        self.fail_after_pages = fail_after_pages
+        self.seed = seed
+
+        self.is_connected = True
+        self._chats: Dict[Union[int, str], SimpleNamespace] = {}
+        self._histories: Dict[int, List[SimpleNamespace]] = {}
+
+        # Counters read back by the benchmark harness
+        self.rpc_calls: Dict[str, int] = {"get_chat": 0, "get_chat_history": 0, "get_discussion_replies_count": 0}
+        self.flood_wait_total = 0
+
+    # --- Lifecycle (mirrors pyrogram.Client) ---
+
+    async def start(self):
+        self.is_connected = True
+        return self
+
+    async def stop(self):
+        self.is_connected = False
+        return self
+
+    # --- Synthetic data ---
+
+    def _chat_for(self, identifier: Union[int, str]) -> SimpleNamespace:
+        key = str(identifier).lstrip("@")
+        if key not in self._chats:
+            # Stable negative id per identifier, like Telegram channel ids (-100...)
+            chat_id = int(identifier) if key.lstrip("-").isdigit() else -1000000000000 - (sum(map(ord, key)) * 7919 % 10 ** 9)
+            chat = SimpleNamespace(
+                id=chat_id,
+                type=ChatType.CHANNEL,
+                title=f"Synthetic {key}",
+                username=None if key.lstrip("-").isdigit() else key,
+                description="Synthetic channel for benchmarks",
+                photo=None,
+                members_count=random.Random(chat_id).randint(1000, 1000000),
+                linked_chat=None
+            )
+            self._chats[key] = chat
+            self._chats[str(chat_id)] = chat
+        return self._chats[key]
+
+    def _history_for(self, chat_id: int) -> List[SimpleNamespace]:
+        if chat_id not in self._histories:
+            rng = random.Random(self.seed ^ chat_id)
+            chat = SimpleNamespace(id=chat_id)
+            now = datetime.now().replace(microsecond=0)
+            step = timedelta(days=self.days) / max(self.history_size, 1)
+
+            history = []
+            group_id, group_left = None, 0
+            for i in range(self.history_size):
+                message_id = self.history_size - i  # Newest first
+                if group_left == 0 and rng.random() < self.media_group_ratio:
+                    group_id, group_left = str(rng.getrandbits(48)), rng.randint(2, 6)
+                media_group_id = group_id if group_left > 0 else None
+                group_left = max(group_left - 1, 0)
+
+                reactions = None
+                if self.reactions:
+                    reactions = SimpleNamespace(reactions=[
+                        SimpleNamespace(count=rng.randint(0, 200)) for _ in range(rng.randint(0, 4))
+                    ])
+
+                history.append(SimpleNamespace(
+                    id=message_id,
+                    chat=chat,
+                    date=now - step * i,
+                    views=rng.randint(100, 100000),
+                    forwards=rng.randint(0, 500),
+                    reactions=reactions,
+                    replies=SimpleNamespace(total_count=rng.randint(0, 50)),
+                    media_group_id=media_group_id
+                ))
+            self._histories[chat_id] = history
+        return self._histories[chat_id]
+
+    async def _rpc(self, name: str):
+        self.rpc_calls[name] += 1
+        if self.fail_after_pages and name == "get_chat_history" and self.rpc_calls[name] == self.fail_after_pages + 1:
+            raise ConnectionError("Synthetic disconnect")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_wait_every and sum(self.rpc_calls.values()) % self.flood_wait_every == 0:
+            self.flood_wait_total += self.flood_wait_seconds
+            if self.flood_wait_seconds > self.sleep_threshold:
+                raise FloodWait(value=self.flood_wait_seconds)
+            await asyncio.sleep(self.flood_wait_seconds)
+
+    # --- Client API ---
+
+    async def get_chat(self, chat_id: Union[int, str]):
+        await self._rpc("get_chat")
+        return self._chat_for(chat_id)
+
+    async def get_chat_history(
+        self,
+        chat_id: Union[int, str],
+        limit: int = 0,
+        offset: int = 0,
+        offset_id: int = 0,
+        offset_date: Optional[datetime] = None
+    ):
+        history = self._history_for(self._chat_for(chat_id).id)
+
+        # Same semantics as Pyrogram: only messages older than offset_id / offset_date
+        start = 0
+        if offset_id:
+            start = next((i for i, m in enumerate(history) if m.id < offset_id), len(history))
+        if offset_date and offset_date.year > 1970:
+            offset_date = offset_date.replace(tzinfo=None)
+            start = max(start, next((i for i, m in enumerate(history) if m.date < offset_date), len(history)))
+        start += max(offset, 0)
+
+        returned = 0
+        for page_start in range(start, len(history), HISTORY_PAGE_SIZE):
+            await self._rpc("get_chat_history")
+            for message in history[page_start:page_start + HISTORY_PAGE_SIZE]:
+                yield message
+                returned += 1
+                if limit and returned >= limit:
+                    return
+
+    async def get_discussion_replies_count(self, chat_id: Union[int, str], message_id: int) -> int:
+        await self._rpc("get_discussion_replies_count")
+        history = self._history_for(self._chat_for(chat_id).id)
+        index = len(history) - message_id
+        if 0 <= index < len(history):
+            return history[index].replies.total_count
+        return 0
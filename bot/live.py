@@ -0,0 +1,148 @@
+import os
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, Optional, Set, Tuple
+
+from pyrogram import Client, filters
+from pyrogram.handlers import MessageHandler, EditedMessageHandler
+
+from models import MessageRecord
+from database import get_session
+from repository import TelegramRepository
+from service import extract_message_data
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- LIVE MODE CONFIGURATION ---
+LIVE_MODE_ENABLED = os.getenv("LIVE_MODE", "false").lower() in ("1", "true", "yes")
+LIVE_FLUSH_SECONDS = float(os.getenv("LIVE_FLUSH_SECONDS", 5))
+LIVE_BATCH_SIZE = int(os.getenv("LIVE_BATCH_SIZE", 50))
+LIVE_TRACKED_REFRESH_SECONDS = int(os.getenv("LIVE_TRACKED_REFRESH_SECONDS", 60))
+
+
+class LiveIngestor:
+    """
+    Writes new and edited posts of tracked channels as they arrive.
+
+    Updates are buffered and flushed through the regular upsert_messages path
+    every LIVE_FLUSH_SECONDS or once LIVE_BATCH_SIZE messages are pending; only
+    the days touched by a flush are recomputed in channel_stats_daily.
+    The account must be a member of a channel to receive its updates.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self._tracked: Set[int] = set()
+        # Channels whose posts table is known to be backfilled
+        self._posts_ready: Set[int] = set()
+        # Keyed by (channel_id, message_id): an edit replaces the pending new message
+        self._buffer: Dict[Tuple[int, int], MessageRecord] = {}
+        self._lock = asyncio.Lock()
+        self._handlers = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.refresh_tracked()
+
+        async def is_tracked(_, __, message) -> bool:
+            return message.chat is not None and message.chat.id in self._tracked
+
+        tracked_filter = filters.create(is_tracked, "TrackedChannelFilter")
+        for handler in (MessageHandler(self._on_message, tracked_filter),
+                        EditedMessageHandler(self._on_message, tracked_filter)):
+            self.client.add_handler(handler)
+            self._handlers.append(handler)
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Live ingestion started for {len(self._tracked)} channels")
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for handler in self._handlers:
+            try:
+                self.client.remove_handler(handler)
+            except Exception as e:
+                logger.warning(f"Error while removing live handler: {e}")
+        self._handlers.clear()
+        await self.flush()
+
+    def refresh_tracked(self):
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            self._tracked = {c.channel_id for c in TelegramRepository(session).get_all_channels()}
+        finally:
+            session.close()
+
+    async def _on_message(self, client: Client, message):
+        if not message.date:
+            return
+
+        message_data = extract_message_data(message, message.chat.id)
+        async with self._lock:
+            self._buffer[(message_data["channel_id"], message_data["message_id"])] = message_data
+            pending = len(self._buffer)
+        metrics.QUEUE_DEPTH.labels(queue="live_buffer").set(pending)
+
+        if pending >= LIVE_BATCH_SIZE:
+            await self.flush()
+
+    async def _restore(self, pending: Dict[Tuple[int, int], MessageRecord]):
+        # Put a failed batch back for the next flush; updates received meanwhile are newer and win
+        async with self._lock:
+            for key, message_data in pending.items():
+                self._buffer.setdefault(key, message_data)
+            depth = len(self._buffer)
+        metrics.QUEUE_DEPTH.labels(queue="live_buffer").set(depth)
+
+    async def _flush_loop(self):
+        since_refresh = 0.0
+        while True:
+            await asyncio.sleep(LIVE_FLUSH_SECONDS)
+            try:
+                await self.flush()
+                since_refresh += LIVE_FLUSH_SECONDS
+                if since_refresh >= LIVE_TRACKED_REFRESH_SECONDS:
+                    # Pick up channels added since startup
+                    self.refresh_tracked()
+                    since_refresh = 0.0
+            except Exception:
+                logger.exception("Live flush failed")
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            pending = dict(self._buffer)
+            self._buffer.clear()
+        metrics.QUEUE_DEPTH.labels(queue="live_buffer").set(0)
+        batch = list(pending.values())
+
+        # Days touched per channel; update_daily_stats recomputes only these
+        touched: Dict[int, Set[date]] = {}
+        for msg in batch:
+            touched.setdefault(msg["channel_id"], set()).add(msg["date"].date())
+
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            repo = TelegramRepository(session)
+            # Before the upsert: its post rows would make ensure_posts skip the backfill,
+            # and update_daily_stats recomputes from posts
+            for channel_id in touched.keys() - self._posts_ready:
+                repo.ensure_posts(channel_id)
+                self._posts_ready.add(channel_id)
+            repo.upsert_messages(batch)
+            for channel_id, days in touched.items():
+                repo.update_daily_stats(channel_id, days)
+        except Exception:
+            await self._restore(pending)
+            raise
+        finally:
+            session.close()
+
+        logger.info(f"Live flush: {len(batch)} messages across {len(touched)} channels")
@@ -1,9 +1,12 @@
 import os
+import time
+import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from zoneinfo import ZoneInfo
 import telegram_client 
 import datetime
@@ -11,14 +14,34 @@ from typing import Optional
 from pyrogram import Client
 
 
+# database.py loads the .env file on import
 from database import create_db_and_tables
 from api import router 
+from scheduler import ScrapeScheduler, SubscriberPoller, SCHEDULER_ENABLED, SUBSCRIBER_POLL_ENABLED
+from live import LiveIngestor, LIVE_MODE_ENABLED
+from service import TelegramService
+import metrics
 
-# Load environment variables from .env file
-load_dotenv()
+try:
+    # Optional: Brotli for clients that accept it, gzip fallback for the rest
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # --- CONFIG & SETUP ---
 
+# --- RESPONSE COMPRESSION ---
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+# --- TELEGRAM CONNECTION ---
+# First retry delay after a failed start; doubles up to the maximum
+TELEGRAM_CONNECT_RETRY_SECONDS = int(os.getenv("TELEGRAM_CONNECT_RETRY_SECONDS", 5))
+TELEGRAM_CONNECT_MAX_RETRY_SECONDS = 300
+TELEGRAM_STOP_TIMEOUT_SECONDS = 5
+
 # --- TIMEZONE CONFIGURATION ---
 TIMEZONE = ZoneInfo("Asia/Tashkent")  # UTC+5
 logger = logging.getLogger(__name__)
@@ -34,31 +57,18 @@ try:
     API_HASH = os.getenv('API_HASH')
 #   BOT_TOKEN = os.getenv('BOT_TOKEN')
 except (TypeError, ValueError):
-    logger.error("FATAL: API_ID, API_HASH, or BOT_TOKEN is missing or invalid in the .env file.")
-    # Raise exception to halt execution if critical credentials are missing
-    raise
-
-# --- TEMPORARY CHECK ---
-print("--- ENV CHECK START ---")
-print(f"API_ID: {API_ID}")
-print(f"API_HASH: {API_HASH[:4]}...{API_HASH[-4:]}") # Print only start/end for security
-#print(f"BOT_TOKEN: {BOT_TOKEN[:4]}...{BOT_TOKEN[-4:]}") # Print only start/end for security
-print("--- ENV CHECK END ---")
-# --- REMOVE THESE LINES AFTER TESTING ---
+    # The DB-backed API still serves; scrape endpoints answer 503
+    logger.error("API_ID or API_HASH is missing or invalid in the .env file. Telegram client disabled.")
+    API_ID = API_HASH = None
 
-# --- LIFECYCLE HANDLER ---
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """
-    Handles startup (database init, Pyrogram start) and shutdown (Pyrogram stop) events.
-    """
-    # NOTE: The pyrogram_client variable is managed in telegram_client.py
-    
-    # 1. Startup tasks
-    logger.info("Initializing Database and Tables...")
-    create_db_and_tables()
-    
-    # Create the client instance and assign it to the module-level variable
+def _scheduled_service() -> Optional[TelegramService]:
+    # The scheduler only dispatches jobs while the Telegram client is usable
+    client_instance = telegram_client.pyrogram_client
+    if client_instance is None or not client_instance.is_connected:
+        return None
+    return TelegramService(client_instance)
+
+def _session_path() -> str:
     # Use sessions/ directory for Docker, current directory for local
     session_path = os.getenv("TELEGRAM_SESSION_PATH")
     if session_path is None:
@@ -67,36 +77,108 @@ async def lifespan(app: FastAPI):
             session_path = "sessions/telegram_scraper_session"
         else:
             session_path = "telegram_scraper_session"
-    
-    telegram_client.pyrogram_client = Client(
-        session_path,
-        api_id=API_ID,
-        api_hash=API_HASH,
-    #   bot_token=BOT_TOKEN if BOT_TOKEN else None,
-    #   in_memory=True
-    )
+    return session_path
 
+async def connect_telegram_client(stopping: asyncio.Event) -> Optional[Client]:
+    """
+    Starts the Pyrogram client, retrying with backoff until it connects.
+    Runs in the background: telegram_client.pyrogram_client is only set once the
+    client is connected, so scrape endpoints answer 503 until then.
+    Returns None if shutdown begins first.
+    """
+    delay = TELEGRAM_CONNECT_RETRY_SECONDS
+    while not stopping.is_set():
+        client = Client(
+            _session_path(),
+            api_id=API_ID,
+            api_hash=API_HASH,
+        #   bot_token=BOT_TOKEN if BOT_TOKEN else None,
+        #   in_memory=True
+        )
+        logger.info("Starting Pyrogram Client...")
+        try:
+            await client.start()
+        except Exception as e:
+            logger.error(f"Failed to start Pyrogram Client (retrying in {delay}s). Check API_ID/API_HASH: {e}")
+            if client.is_connected:
+                try:
+                    await client.stop()
+                except Exception:
+                    pass
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, TELEGRAM_CONNECT_MAX_RETRY_SECONDS)
+            continue
 
-    
-    logger.info("Starting Pyrogram Client...")
-    try:
-        # Pyrogram client MUST be started before any service logic is called
-        await telegram_client.pyrogram_client.start()
+        if stopping.is_set():
+            # Shutdown began while the client was starting
+            await client.stop()
+            return None
+
+        telegram_client.pyrogram_client = client
         logger.info("Pyrogram Client started successfully.")
-    except Exception as e:
-        # We stop and unassign the client if startup fails
-        if telegram_client.pyrogram_client:
-             await telegram_client.pyrogram_client.stop()
-        telegram_client.pyrogram_client = None
-        
-        logger.error(f"Failed to start Pyrogram Client. Check API_ID/API_HASH/BOT_TOKEN: {e}")
-        # Re-raise to prevent the server from starting with a broken client
-        raise
+        return client
+    return None
+
+# --- LIFECYCLE HANDLER ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Handles startup (database init, background Pyrogram start) and shutdown (Pyrogram stop) events.
+    The API accepts requests without waiting for Telegram.
+    """
+    # NOTE: The pyrogram_client variable is managed in telegram_client.py
     
+    # 1. Startup tasks (schema checks are skipped when the stored version matches)
+    logger.info("Initializing Database and Tables...")
+    create_db_and_tables()
+
+    # Real-time ingestion of new posts (opt-in via LIVE_MODE), attached once connected
+    live_ingestors = []
+
+    stopping = asyncio.Event()
+
+    async def start_telegram():
+        client = await connect_telegram_client(stopping)
+        if client is not None and LIVE_MODE_ENABLED:
+            live_ingestor = LiveIngestor(client)
+            live_ingestor.start()
+            live_ingestors.append(live_ingestor)
+
+    connect_task = None
+    if API_ID is not None:
+        connect_task = asyncio.create_task(start_telegram())
+
+    # Adaptive periodic re-scrapes (opt-in via SCHEDULER_ENABLED); idle until the client connects
+    scheduler = None
+    if SCHEDULER_ENABLED:
+        scheduler = ScrapeScheduler(service_factory=_scheduled_service)
+        scheduler.start()
+
+    # Subscriber count history without history walks (opt-in via SUBSCRIBER_POLL_ENABLED)
+    subscriber_poller = None
+    if SUBSCRIBER_POLL_ENABLED:
+        subscriber_poller = SubscriberPoller(service_factory=_scheduled_service)
+        subscriber_poller.start()
+
     # Yield control back to FastAPI to start accepting requests
     yield
     
     # 2. Shutdown tasks run after the server shuts down
+    stopping.set()
+    if connect_task and not connect_task.done():
+        # Pyrogram may swallow the cancellation mid-handshake; do not wait on it forever
+        connect_task.cancel()
+        await asyncio.wait({connect_task}, timeout=TELEGRAM_STOP_TIMEOUT_SECONDS)
+    if scheduler:
+        await scheduler.stop()
+    if subscriber_poller:
+        await subscriber_poller.stop()
+    for live_ingestor in live_ingestors:
+        await live_ingestor.stop()
+
     logger.info("Stopping Pyrogram Client...")
     if telegram_client.pyrogram_client:
         try:
@@ -107,7 +189,22 @@ async def lifespan(app: FastAPI):
         telegram_client.pyrogram_client = None 
 
 # --- APP ---
-app = FastAPI(title="Telegram Scraper Service", version="3.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Telegram Scraper Service",
+    version="3.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+if BrotliMiddleware is not None:
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=BROTLI_QUALITY,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_fallback=True
+    )
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE, compresslevel=GZIP_LEVEL)
 
 # Configure CORS
 app.add_middleware(
@@ -118,6 +215,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/messages/{channel_id}) to keep cardinality bounded
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        ).observe(time.perf_counter() - started)
+
 # Register API Routes from api.py
 app.include_router(router)
 
@@ -0,0 +1,118 @@
+import time
+import functools
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+from ratelimit import HISTORY_PAGE_SIZE
+
+# --- PROMETHEUS METRICS ---
+
+RPC_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+TELEGRAM_RPC_SECONDS = Histogram(
+    "telegram_rpc_seconds",
+    "Latency of Telegram RPCs issued by the scraper",
+    ["method"],
+    buckets=RPC_BUCKETS
+)
+DB_FLUSH_SECONDS = Histogram(
+    "db_flush_seconds",
+    "Latency of repository write operations",
+    ["operation"],
+    buckets=DB_BUCKETS
+)
+SCRAPE_MESSAGES_PER_SECOND = Histogram(
+    "scrape_messages_per_second",
+    "Average throughput of finished scrape jobs",
+    buckets=RATE_BUCKETS
+)
+SCRAPE_MESSAGES_TOTAL = Counter(
+    "scrape_messages_total",
+    "Messages processed by scrape jobs"
+)
+SCRAPE_JOBS_TOTAL = Counter(
+    "scrape_jobs_total",
+    "Finished scrape jobs by outcome",
+    ["outcome"]
+)
+FLOOD_WAIT_SECONDS = Counter(
+    "telegram_flood_wait_seconds_total",
+    "Seconds spent sleeping on FloodWait"
+)
+QUEUE_DEPTH = Gauge(
+    "scraper_queue_depth",
+    "Work waiting or in progress, by queue",
+    ["queue"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "HTTP endpoint latency",
+    ["method", "route", "status"],
+    buckets=DB_BUCKETS
+)
+
+
+@contextmanager
+def time_rpc(method: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TELEGRAM_RPC_SECONDS.labels(method=method).observe(time.perf_counter() - started)
+
+
+def timed_db(operation: str):
+    """Decorator recording the duration of a repository write."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                DB_FLUSH_SECONDS.labels(operation=operation).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+async def timed_history(history: AsyncIterator) -> AsyncIterator:
+    """
+    Wraps a get_chat_history iterator and records one observation per page.
+    The time spent waiting for the messages of a page adds up to its RPC latency.
+    """
+    waited = 0.0
+    count = 0
+    iterator = history.__aiter__()
+    while True:
+        started = time.perf_counter()
+        try:
+            message = await iterator.__anext__()
+        except StopAsyncIteration:
+            waited += time.perf_counter() - started
+            if count % HISTORY_PAGE_SIZE or count == 0:
+                TELEGRAM_RPC_SECONDS.labels(method="get_chat_history").observe(waited)
+            return
+        waited += time.perf_counter() - started
+        count += 1
+        if count % HISTORY_PAGE_SIZE == 0:
+            TELEGRAM_RPC_SECONDS.labels(method="get_chat_history").observe(waited)
+            waited = 0.0
+        yield message
+
+
+def track_scrape_queue(status: Dict[str, Dict], finished_states):
+    """Exposes pending/running scrape counts computed from the live status dict."""
+    QUEUE_DEPTH.labels(queue="scrape_pending").set_function(
+        lambda: sum(1 for d in status.values() if d.get("status") == "pending")
+    )
+    QUEUE_DEPTH.labels(queue="scrape_running").set_function(
+        lambda: sum(1 for d in status.values() if d.get("status") not in finished_states and d.get("status") != "pending")
+    )
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,7 +1,7 @@
 from datetime import date, datetime
-from typing import Optional, List, TypedDict
+from typing import Optional, List, Dict, TypedDict
 from sqlmodel import SQLModel, Field
-from sqlalchemy import BigInteger, UniqueConstraint, Date
+from sqlalchemy import BigInteger, UniqueConstraint, Date, Index
 
 # --- TYPING FOR REPOSITORY INPUTS ---
 
@@ -28,13 +28,39 @@ class MessageData(TypedDict):
     media_group_id: Optional[str]
     # Add other fields as needed
 
-class DailyMetrics(TypedDict):
-    """Metrics for a single day."""
-    posts: int
-    views: int
-    reactions: int # EXTENSIBILITY
-    replies: int   # EXTENSIBILITY
-    forwards: int  # EXTENSIBILITY
+class MessageRecord:
+    """
+    Compact MessageData used on the scrape path: fixed slots instead of a per-row dict.
+    Supports the read-only mapping access the repository uses (record["views"],
+    record.get(...), dict(record), Message(**record)).
+    """
+    __slots__ = ("channel_id", "message_id", "date", "views", "reactions", "replies", "forwards", "media_group_id")
+
+    def __init__(self, channel_id: int, message_id: int, date: datetime, views: int,
+                 reactions: int, replies: int, forwards: int, media_group_id: Optional[str]):
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.date = date
+        self.views = views
+        self.reactions = reactions
+        self.replies = replies
+        self.forwards = forwards
+        self.media_group_id = media_group_id
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self) -> str:
+        return f"MessageRecord({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
 
 # --- DATABASE MODELS ---
 
@@ -56,6 +82,9 @@ class Message(SQLModel, table=True):
     __tablename__ = "messages"
     __table_args__ = (
         UniqueConstraint("channel_id", "message_id", name="unique_channel_message"),
+        # Range scans and rankings per channel
+        Index("ix_messages_channel_date", "channel_id", "date"),
+        Index("ix_messages_channel_views", "channel_id", "views"),
     )
 
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -72,6 +101,82 @@ class Message(SQLModel, table=True):
     forwards: int = Field(default=0)
 
 
+class Post(SQLModel, table=True):
+    """
+    One logical post: an album (all messages sharing a media_group_id) or a single message.
+    Maintained from messages on every upsert, so daily counts and rankings need no grouping.
+    """
+    __tablename__ = "posts"
+    __table_args__ = (
+        UniqueConstraint("channel_id", "post_key", name="unique_channel_post"),
+        Index("ix_posts_channel_date", "channel_id", "date"),
+        Index("ix_posts_channel_views", "channel_id", "views"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    channel_id: int = Field(sa_type=BigInteger, nullable=False)
+    post_key: str = Field(nullable=False)                       # "g<media_group_id>" or "m<message_id>"
+    message_id: int = Field(sa_type=BigInteger, nullable=False)  # first message of the post
+    media_group_id: Optional[str] = Field(default=None)
+    date: datetime = Field(nullable=False)
+    items: int = Field(default=1)
+
+    # Summed over the items of an album; max_views is the reach of the post itself
+    views: int = Field(default=0)
+    max_views: int = Field(default=0)
+    reactions: int = Field(default=0)
+    replies: int = Field(default=0)
+    forwards: int = Field(default=0)
+
+
+class MessageSnapshot(SQLModel, table=True):
+    """
+    Append-only metric history of a message, written only when a metric changed.
+    Values are deltas against the previous snapshot of the same message
+    (the first snapshot holds the absolute values), so a running sum
+    reconstructs the growth curve.
+    """
+    __tablename__ = "message_snapshots"
+    __table_args__ = (
+        # Compaction selects a channel's rows by age, which the primary key cannot serve
+        Index("ix_message_snapshots_channel_scraped", "channel_id", "scraped_at"),
+    )
+
+    # Composite primary key, no surrogate id
+    channel_id: int = Field(sa_type=BigInteger, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    message_id: int = Field(sa_type=BigInteger, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    scraped_at: datetime = Field(primary_key=True)
+
+    views: int = Field(default=0)
+    reactions: int = Field(default=0)
+    replies: int = Field(default=0)
+    forwards: int = Field(default=0)
+
+
+class SubscriberSnapshot(SQLModel, table=True):
+    """
+    Subscriber count history of a channel, written only when the count changed.
+    The count stays valid until the next row.
+    """
+    __tablename__ = "subscriber_snapshots"
+
+    channel_id: int = Field(sa_type=BigInteger, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    captured_at: datetime = Field(primary_key=True)
+    subscriber_count: int = Field(nullable=False)
+
+
+class SchemaVersion(SQLModel, table=True):
+    """
+    Fingerprint of the schema last applied by create_db_and_tables (single row).
+    """
+    __tablename__ = "schema_version"
+
+    id: int = Field(default=1, primary_key=True)
+    version: str = Field(nullable=False)
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ChannelStatsDaily(SQLModel, table=True):
     __tablename__ = "channel_stats_daily"
     __table_args__ = (
@@ -98,6 +203,31 @@ class ScrapeRun(SQLModel, table=True):
 
     last_scraped_id: Optional[int] = Field(default=None, sa_type=BigInteger)
     last_scraped_at: datetime = Field(default_factory=datetime.utcnow)
+    snapshots_compacted_at: Optional[datetime] = Field(default=None)
+
+    # Adaptive refresh schedule (maintained by scheduler.py)
+    refresh_interval_seconds: Optional[int] = Field(default=None)
+    next_scrape_at: Optional[datetime] = Field(default=None, index=True)
+
+
+class ScrapeCheckpoint(SQLModel, table=True):
+    """
+    Resume point of an interrupted shard walk: every message between lowest_date
+    and range_end has been flushed (the whole range once completed is set).
+    Removed when the scrape job finishes, or dropped unused once older than
+    SCRAPE_CHECKPOINT_TTL_HOURS.
+    """
+    __tablename__ = "scrape_checkpoints"
+
+    channel_id: int = Field(sa_type=BigInteger, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    range_start: date = Field(sa_type=Date, primary_key=True)
+    range_end: date = Field(sa_type=Date, nullable=False)
+
+    lowest_message_id: int = Field(sa_type=BigInteger, nullable=False)
+    lowest_date: datetime = Field(nullable=False)
+    messages_flushed: int = Field(default=0)
+    completed: bool = Field(default=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 # --- API REQUEST/RESPONSE SCHEMAS ---
@@ -106,6 +236,19 @@ class ScrapeRequest(SQLModel):
     channel_identifier: str
     start_date: date
     end_date: Optional[date] = Field(default_factory=date.today)
+    # Split the date range into this many shards walked concurrently
+    shards: int = Field(default=1, ge=1, le=32)
+    # Continue interrupted shards from their checkpoint instead of the newest post
+    resume: bool = True
+
+
+class BulkScrapeRequest(SQLModel):
+    channel_identifiers: List[str] = Field(min_length=1, max_length=5000)
+    start_date: date
+    end_date: Optional[date] = Field(default_factory=date.today)
+    shards: int = Field(default=1, ge=1, le=32)
+    # Channels scraped at the same time within this batch
+    concurrency: Optional[int] = Field(default=None, ge=1, le=20)
 
 
 class ScrapeStatusResponse(SQLModel):
@@ -114,6 +257,63 @@ class ScrapeStatusResponse(SQLModel):
     messages_processed: int
     current_message_date: Optional[datetime] = None
     error: Optional[str] = None
+    # Outcome of message writes: unchanged rows are skipped entirely
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    rows_unchanged: int = 0
+    shards: Optional[int] = None
+    # Throughput and ETA (rate is averaged over the last 30 seconds)
+    messages_per_second: Optional[float] = None
+    progress: Optional[float] = None        # 0..1 share of the date window covered
+    eta_seconds: Optional[float] = None
+    elapsed_seconds: Optional[float] = None
+    flood_wait_seconds: Optional[float] = None
+    db_flush_seconds: Optional[float] = None
+
+
+class BulkScrapeResponse(SQLModel):
+    batch_id: str
+    status: str
+    total: int                          # unique, valid identifiers in the batch
+    duplicates: int = 0
+    invalid: List[str] = []
+    unresolved: Dict[str, str] = {}     # identifier -> resolution error
+    pending: int = 0
+    running: int = 0
+    completed: int = 0
+    failed: int = 0
+    messages_processed: int = 0
+    channels: List[ScrapeStatusResponse] = []
+
+
+class TopPostsResponse(SQLModel):
+    channel_id: int
+    period_start: date
+    period_end: date
+    metric: str
+    # message_id, date, items (album size), views, reactions, replies, forwards, engagement_rate
+    posts: List[dict]
+
+
+class ChannelComparisonResponse(SQLModel):
+    period_start: date
+    period_end: date
+    previous_period_start: date
+    previous_period_end: date
+    # Per channel: totals, averages per post, growth vs previous period, percentile ranks (0..1)
+    channels: List[dict]
+
+
+class SubscriberGrowthResponse(SQLModel):
+    channel_id: int
+    period_start: date
+    period_end: date
+    start_count: Optional[int] = None
+    end_count: Optional[int] = None
+    change: Optional[int] = None
+    change_pct: Optional[float] = None
+    # One point per day: subscriber count at the end of the day
+    points: List[dict]
 
 
 class AnalyticsResponse(SQLModel):
@@ -126,4 +326,28 @@ class AnalyticsResponse(SQLModel):
     total_reactions: int 
     total_replies: int
     total_forwards: int
-    daily_breakdown: List[dict]
\ No newline at end of file
+    daily_breakdown: List[dict]
+
+
+class GrowthPoint(SQLModel):
+    timestamp: datetime
+    views: int
+    reactions: int
+    replies: int
+    forwards: int
+
+
+class MessageGrowthResponse(SQLModel):
+    channel_id: int
+    message_id: int
+    points: List[GrowthPoint]
+
+
+class ChannelGrowthResponse(SQLModel):
+    channel_id: int
+    period_start: date
+    period_end: date
+    bucket: str
+    # Per bucket: metrics gained inside the bucket, baseline_views of posts first seen in it;
+    # cumulative_views is the running total
+    points: List[dict]
@@ -0,0 +1,68 @@
+import os
+import time
+import asyncio
+from typing import AsyncIterator
+
+# --- GLOBAL TELEGRAM REQUEST BUDGET ---
+TELEGRAM_RPC_PER_SECOND = float(os.getenv("TELEGRAM_RPC_PER_SECOND", 20))
+TELEGRAM_RPC_BURST = int(os.getenv("TELEGRAM_RPC_BURST", 20))
+
+# Pyrogram fetches history in pages of this many messages
+HISTORY_PAGE_SIZE = 100
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every coroutine talking to Telegram.
+
+    A FloodWait reported by any caller pauses the whole bucket, so parallel
+    shards and jobs back off together instead of hammering the account.
+    A rate of 0 disables limiting (pauses still apply).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                if self.rate <= 0:
+                    return
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+async def limited_history(history: AsyncIterator, limiter: "RateLimiter") -> AsyncIterator:
+    """Acquires one token before each page of a get_chat_history walk."""
+    count = 0
+    iterator = history.__aiter__()
+    while True:
+        if count % HISTORY_PAGE_SIZE == 0:
+            await limiter.acquire()
+        try:
+            message = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        count += 1
+        yield message
+
+
+TELEGRAM_LIMITER = RateLimiter(TELEGRAM_RPC_PER_SECOND, TELEGRAM_RPC_BURST)
@@ -1,17 +1,34 @@
-from typing import List, Optional, Dict
-from datetime import date, datetime
+from typing import List, Optional, Dict, Tuple, Iterable
+from datetime import date, datetime, timedelta
 from sqlmodel import Session, select, func, col, delete
-from sqlalchemy import asc, String
-from models import Channel, Message, ChannelStatsDaily, ScrapeRun
-from models import ChannelData, MessageData, DailyMetrics
+from sqlalchemy import asc, String, or_, Float, BigInteger, bindparam, case
+from models import Channel, Message, ChannelStatsDaily, ScrapeRun, MessageSnapshot, Post, SubscriberSnapshot
+from models import ScrapeCheckpoint
+from models import ChannelData, MessageData
 import logging
+import os
+from metrics import timed_db
+from database import mark_written
 
 logger = logging.getLogger(__name__) 
 
+METRIC_FIELDS = ("views", "reactions", "replies", "forwards")
+
+# Snapshot retention policy: hourly-or-finer history is kept for SNAPSHOT_DOWNSAMPLE_DAYS,
+# then reduced to one row per message per day; past SNAPSHOT_RETENTION_DAYS everything
+# is folded into a single baseline row per message.
+SNAPSHOT_DOWNSAMPLE_DAYS = int(os.getenv("SNAPSHOT_DOWNSAMPLE_DAYS", 7))
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", 180))
+# Compaction runs at most this often per channel and only covers rows aged since the last run
+SNAPSHOT_COMPACT_HOURS = float(os.getenv("SNAPSHOT_COMPACT_HOURS", 24))
+# Subscriber history older than this keeps only the last count of each day
+SUBSCRIBER_DOWNSAMPLE_DAYS = int(os.getenv("SUBSCRIBER_DOWNSAMPLE_DAYS", 30))
+
 class TelegramRepository:
     def __init__(self, session: Session):
         self.session = session
 
+    @timed_db("upsert_channel")
     def upsert_channel(self, channel_data: ChannelData) -> Channel:
         with self.session:
             channel = self.session.exec(
@@ -19,27 +36,68 @@ class TelegramRepository:
             ).first()
             
             if channel:
-                for key, value in channel_data.items():
-                    if key != 'channel_id':
-                        setattr(channel, key, value) 
+                changed = {
+                    key: value for key, value in channel_data.items()
+                    if key != 'channel_id' and getattr(channel, key) != value
+                }
+                if not changed:
+                    # Nothing to write: skip the UPDATE and the refresh round trip
+                    return channel
+                for key, value in changed.items():
+                    setattr(channel, key, value) 
                 self.session.add(channel)
             else:
                 channel = Channel(**channel_data) 
                 self.session.add(channel)
                 
             self.session.commit()
+            mark_written(None)
+            mark_written(channel.channel_id)
             self.session.refresh(channel)
             return channel
 
-    def upsert_messages(self, messages_data: List[MessageData]):
+    @timed_db("upsert_messages")
+    def upsert_messages(self, messages_data: List[MessageData]) -> Dict[str, int]:
+        """
+        Writes only new messages and messages whose metrics changed.
+        Returns {"inserted", "updated", "unchanged"} row counts for the batch.
+        """
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
         if not messages_data:
-            return
+            return counts
+
+        scraped_at = datetime.utcnow()
+        previous = self._get_current_metrics(messages_data)
+
+        # Drop rows identical to what is stored: no dead tuples, no WAL, no snapshot
+        changed = []
+        for msg in messages_data:
+            stored = previous.get((msg['channel_id'], msg['message_id']))
+            if stored is None:
+                counts["inserted"] += 1
+            elif stored != tuple(msg[field] or 0 for field in METRIC_FIELDS):
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+                continue
+            changed.append(msg)
+
+        if not changed:
+            return counts
+
+        # Messages stored before snapshots existed get an absolute first row, not a delta
+        updated_keys = [(msg['channel_id'], msg['message_id']) for msg in changed
+                        if (msg['channel_id'], msg['message_id']) in previous]
+        with_history = self._get_snapshotted(updated_keys)
+        snapshots = self._build_snapshots(
+            changed, {key: previous[key] for key in updated_keys if key in with_history}, scraped_at
+        )
 
         # 1. Try High-Performance PostgreSQL Upsert
         try:
             from sqlalchemy.dialects.postgresql import insert
             
-            data_to_insert = [dict(msg) for msg in messages_data]
+            data_to_insert = [dict(msg) for msg in changed]
             stmt = insert(Message).values(data_to_insert)
             
             # Map columns to update on conflict
@@ -52,133 +110,450 @@ class TelegramRepository:
                 "media_group_id": stmt.excluded.media_group_id
             }
             
+            # Guard against concurrent writers: still skip rows whose metrics match
             stmt = stmt.on_conflict_do_update(
                 index_elements=[Message.channel_id, Message.message_id],
-                set_=update_cols
+                set_=update_cols,
+                where=or_(*[
+                    getattr(Message, field).is_distinct_from(getattr(stmt.excluded, field))
+                    for field in METRIC_FIELDS
+                ])
             )
             
             with self.session:
                 self.session.execute(stmt)
+                self._insert_snapshots(snapshots)
                 self.session.commit()
 
         except (ImportError, Exception) as e:
-            # 2. Fallback: Standard SQLModel Merge (Slower but reliable)
-            # This fixes the "updates not saved" bug.
-            # session.merge() checks primary key; if exists, it UPDATES. If not, it INSERTS.
+            # 2. Fallback: Core executemany (no ORM object per row)
+            # Only changed rows reach this point; new ones are inserted without a lookup.
+            table = Message.__table__
+            new_rows = []
+            updated_rows = []
+            for msg_data in changed:
+                if (msg_data['channel_id'], msg_data['message_id']) not in previous:
+                    new_rows.append(dict(msg_data))
+                else:
+                    updated_rows.append({
+                        "b_channel_id": msg_data['channel_id'],
+                        "b_message_id": msg_data['message_id'],
+                        **{f"b_{field}": msg_data[field] for field in METRIC_FIELDS},
+                        "b_media_group_id": msg_data.get('media_group_id')
+                    })
+
             with self.session:
-                for msg_data in messages_data:
-                    # We manually construct the object to merge
-                    # Note: We must query to find the primary key 'id' if we want to merge properly 
-                    # without purely relying on the unique constraint, but simpler here:
-                    
-                    # Safer Fallback approach: Check existence manually
-                    existing = self.session.exec(
-                        select(Message).where(
-                            Message.channel_id == msg_data['channel_id'],
-                            Message.message_id == msg_data['message_id']
+                if new_rows:
+                    self.session.execute(table.insert(), new_rows)
+                if updated_rows:
+                    self.session.execute(
+                        table.update()
+                        .where(
+                            table.c.channel_id == bindparam("b_channel_id"),
+                            table.c.message_id == bindparam("b_message_id")
                         )
-                    ).first()
-
-                    if existing:
-                        # UPDATE
-                        existing.views = msg_data['views']
-                        existing.reactions = msg_data['reactions']
-                        existing.replies = msg_data['replies']
-                        existing.forwards = msg_data['forwards']
-                        existing.media_group_id = msg_data.get('media_group_id')
-                        self.session.add(existing)
-                    else:
-                        # INSERT
-                        self.session.add(Message(**msg_data))
-                
+                        .values(
+                            **{field: bindparam(f"b_{field}") for field in METRIC_FIELDS},
+                            media_group_id=bindparam("b_media_group_id")
+                        ),
+                        updated_rows
+                    )
+                self._insert_snapshots(snapshots)
                 self.session.commit()
 
-    def update_daily_stats(self, channel_id: int, stats_buffer: Dict[date, DailyMetrics]):
-            dates_to_update = list(stats_buffer.keys())
-            
-            with self.session:
-                for day in dates_to_update:
-                    start_of_day = datetime.combine(day, datetime.min.time())
-                    end_of_day = datetime.combine(day, datetime.max.time())
-
-                    # Count posts correctly:
-                    # - Messages without media_group_id count as 1 post each
-                    # - Messages with same media_group_id count as 1 post total (album/grouped media)
-                    # Use a subquery to count distinct media groups + non-grouped messages
-                    
-                    # Subquery: Get one representative message per media_group_id
-                    from sqlalchemy import case, literal
-                    
-                    # Count logic:
-                    # 1. For messages WITH media_group_id: count distinct media_group_id
-                    # 2. For messages WITHOUT media_group_id: count each message
-                    distinct_posts_query = select(
-                        func.count(
-                            func.distinct(
-                                case(
-                                    (Message.media_group_id.is_not(None), Message.media_group_id),
-                                    else_=func.cast(Message.id, String)
-                                )
-                            )
-                        ).label("posts")
-                    ).where(
-                        Message.channel_id == channel_id,
-                        Message.date >= start_of_day,
-                        Message.date <= end_of_day
-                    )
-                    
-                    posts_result = self.session.exec(distinct_posts_query).first()
-                    posts = posts_result if posts_result else 0
-                    
-                    # Sum metrics (views, reactions, etc.) from all messages
-                    metrics_statement = select(
-                        func.coalesce(func.sum(Message.views), 0).label("views"),
-                        func.coalesce(func.sum(Message.reactions), 0).label("reactions"),
-                        func.coalesce(func.sum(Message.replies), 0).label("replies"),
-                        func.coalesce(func.sum(Message.forwards), 0).label("forwards")
-                    ).where(
-                        Message.channel_id == channel_id,
-                        Message.date >= start_of_day,
-                        Message.date <= end_of_day
+        self.refresh_posts(changed)
+        for channel_id in {msg['channel_id'] for msg in changed}:
+            mark_written(channel_id)
+        return counts
+
+    @staticmethod
+    def _post_key(media_group_id: Optional[str], message_id: int) -> str:
+        return f"g{media_group_id}" if media_group_id else f"m{message_id}"
+
+    @timed_db("refresh_posts")
+    def refresh_posts(self, messages_data: List[MessageData]):
+        """
+        Re-aggregates the posts touched by these messages from the messages table.
+        Albums split across scrape batches converge to the full album.
+        """
+        if not messages_data:
+            return
+
+        by_channel: Dict[int, Tuple[set, set]] = {}
+        for msg in messages_data:
+            group_ids, message_ids = by_channel.setdefault(msg['channel_id'], (set(), set()))
+            if msg.get('media_group_id'):
+                group_ids.add(msg['media_group_id'])
+            else:
+                message_ids.add(msg['message_id'])
+
+        with self.session:
+            for channel_id, (group_ids, message_ids) in by_channel.items():
+                conditions = []
+                if group_ids:
+                    conditions.append(col(Message.media_group_id).in_(group_ids))
+                if message_ids:
+                    conditions.append(col(Message.message_id).in_(message_ids))
+                rows = self.session.exec(
+                    select(Message).where(Message.channel_id == channel_id, or_(*conditions))
+                ).all()
+                self._write_posts(channel_id, rows)
+            self.session.commit()
+
+    def _write_posts(self, channel_id: int, messages: List[Message]):
+        posts: Dict[str, dict] = {}
+        for msg in messages:
+            key = self._post_key(msg.media_group_id, msg.message_id)
+            post = posts.get(key)
+            if post is None:
+                posts[key] = {
+                    "channel_id": channel_id,
+                    "post_key": key,
+                    "message_id": msg.message_id,
+                    "media_group_id": msg.media_group_id,
+                    "date": msg.date,
+                    "items": 1,
+                    "views": msg.views or 0,
+                    "max_views": msg.views or 0,
+                    "reactions": msg.reactions or 0,
+                    "replies": msg.replies or 0,
+                    "forwards": msg.forwards or 0,
+                }
+                continue
+            post["items"] += 1
+            post["message_id"] = min(post["message_id"], msg.message_id)
+            post["date"] = min(post["date"], msg.date)
+            post["max_views"] = max(post["max_views"], msg.views or 0)
+            for field in METRIC_FIELDS:
+                post[field] += getattr(msg, field) or 0
+
+        if not posts:
+            return
+
+        existing = {
+            post.post_key: post
+            for post in self.session.exec(
+                select(Post).where(Post.channel_id == channel_id, col(Post.post_key).in_(list(posts)))
+            ).all()
+        }
+        for key, values in posts.items():
+            post = existing.get(key)
+            if post is None:
+                self.session.add(Post(**values))
+                continue
+            for field, value in values.items():
+                setattr(post, field, value)
+            self.session.add(post)
+
+    def ensure_posts(self, channel_id: int):
+        """
+        Backfills posts for a channel whose messages predate the posts table.
+        """
+        has_posts = self.session.exec(select(Post.id).where(Post.channel_id == channel_id).limit(1)).first()
+        if has_posts is not None:
+            return
+        # Aggregated in the database: same grouping as _post_key, without loading every message
+        group_id = func.nullif(Message.media_group_id, "")
+        keyed = select(
+            Message.message_id,
+            Message.media_group_id,
+            Message.date,
+            *[getattr(Message, field) for field in METRIC_FIELDS],
+            case(
+                (group_id.is_not(None), "g" + group_id),
+                else_="m" + func.cast(Message.message_id, String)
+            ).label("post_key")
+        ).where(Message.channel_id == channel_id).subquery()
+
+        aggregated = select(
+            bindparam("channel_id", channel_id, type_=BigInteger),
+            keyed.c.post_key,
+            func.min(keyed.c.message_id),
+            func.max(keyed.c.media_group_id),
+            func.min(keyed.c.date),
+            func.count(),
+            func.coalesce(func.sum(keyed.c.views), 0),
+            func.coalesce(func.max(keyed.c.views), 0),
+            *[func.coalesce(func.sum(keyed.c[field]), 0) for field in ("reactions", "replies", "forwards")]
+        ).group_by(keyed.c.post_key)
+
+        columns = ["channel_id", "post_key", "message_id", "media_group_id", "date", "items",
+                   "views", "max_views", "reactions", "replies", "forwards"]
+        with self.session:
+            self.session.execute(Post.__table__.insert().from_select(columns, aggregated))
+            self.session.commit()
+
+    def _get_current_metrics(self, messages_data: List[MessageData]) -> Dict[Tuple[int, int], Tuple[int, ...]]:
+        """
+        Loads the stored metrics of the messages in this batch, keyed by (channel_id, message_id).
+        """
+        ids_by_channel: Dict[int, List[int]] = {}
+        for msg in messages_data:
+            ids_by_channel.setdefault(msg['channel_id'], []).append(msg['message_id'])
+
+        current = {}
+        for channel_id, message_ids in ids_by_channel.items():
+            rows = self.session.exec(
+                select(Message.message_id, Message.views, Message.reactions, Message.replies, Message.forwards)
+                .where(Message.channel_id == channel_id, col(Message.message_id).in_(message_ids))
+            ).all()
+            for message_id, *metrics in rows:
+                current[(channel_id, message_id)] = tuple(m or 0 for m in metrics)
+        return current
+
+    def _get_snapshotted(self, keys: List[Tuple[int, int]]) -> set:
+        """
+        Returns the (channel_id, message_id) keys among these that already have a snapshot.
+        """
+        ids_by_channel: Dict[int, List[int]] = {}
+        for channel_id, message_id in keys:
+            ids_by_channel.setdefault(channel_id, []).append(message_id)
+
+        found = set()
+        for channel_id, message_ids in ids_by_channel.items():
+            rows = self.session.exec(
+                select(MessageSnapshot.message_id).distinct()
+                .where(MessageSnapshot.channel_id == channel_id, col(MessageSnapshot.message_id).in_(message_ids))
+            ).all()
+            found.update((channel_id, message_id) for message_id in rows)
+        return found
+
+    @staticmethod
+    def _build_snapshots(
+        messages_data: List[MessageData],
+        previous: Dict[Tuple[int, int], Tuple[int, ...]],
+        scraped_at: datetime
+    ) -> List[dict]:
+        """
+        Delta-encodes the batch against the stored metrics. Unchanged messages produce no row.
+        """
+        snapshots = []
+        for msg in messages_data:
+            before = previous.get((msg['channel_id'], msg['message_id']), (0, 0, 0, 0))
+            deltas = [(msg[field] or 0) - (old or 0) for field, old in zip(METRIC_FIELDS, before)]
+            if not any(deltas):
+                continue
+            row = {"channel_id": msg['channel_id'], "message_id": msg['message_id'], "scraped_at": scraped_at}
+            row.update(zip(METRIC_FIELDS, deltas))
+            snapshots.append(row)
+        return snapshots
+
+    def _insert_snapshots(self, snapshots: List[dict]):
+        if snapshots:
+            self.session.execute(MessageSnapshot.__table__.insert(), snapshots)
+
+    @timed_db("compact_snapshots")
+    def compact_snapshots(self, channel_id: int, now: Optional[datetime] = None):
+        """
+        Applies the snapshot retention policy to one channel. Deltas are additive,
+        so merging rows keeps the reconstructed curve exact at the kept points.
+        """
+        now = now or datetime.utcnow()
+        run = self.get_scrape_run(channel_id)
+        last = run.snapshots_compacted_at if run else None
+        if last is not None and now - last < timedelta(hours=SNAPSHOT_COMPACT_HOURS):
+            return
+
+        retention, downsample = timedelta(days=SNAPSHOT_RETENTION_DAYS), timedelta(days=SNAPSHOT_DOWNSAMPLE_DAYS)
+        with self.session:
+            # Everything beyond retention becomes one baseline row per message
+            self._merge_snapshots(channel_id, now - retention, last and last - retention, daily=False)
+            # Older history keeps one row per message per day
+            self._merge_snapshots(channel_id, now - downsample, last and last - downsample, daily=True)
+
+            run = self.session.exec(select(ScrapeRun).where(ScrapeRun.channel_id == channel_id)).first()
+            if run:
+                run.snapshots_compacted_at = now
+                self.session.add(run)
+            self.session.commit()
+
+    def _merge_snapshots(self, channel_id: int, before: datetime, since: Optional[datetime], daily: bool):
+        """
+        Merges the rows older than before. With since (the cutoff of the previous
+        compaction), only rows that crossed the cutoff since then are regrouped.
+        """
+        window = [MessageSnapshot.channel_id == channel_id, MessageSnapshot.scraped_at < before]
+        if since is not None:
+            # Whole days: the previous run may have merged part of the day at its cutoff
+            lower = datetime.combine(since.date(), datetime.min.time())
+            if daily:
+                window.append(MessageSnapshot.scraped_at >= lower)
+            else:
+                # The baseline row of a message is older than the window, so regroup whole messages
+                aged = select(MessageSnapshot.message_id).where(
+                    MessageSnapshot.channel_id == channel_id,
+                    MessageSnapshot.scraped_at >= lower,
+                    MessageSnapshot.scraped_at < before
+                )
+                window.append(col(MessageSnapshot.message_id).in_(aged))
+
+        group_cols = [MessageSnapshot.message_id]
+        if daily:
+            group_cols.append(func.date(MessageSnapshot.scraped_at))
+
+        merged = self.session.exec(
+            select(
+                MessageSnapshot.message_id,
+                func.max(MessageSnapshot.scraped_at),
+                func.count(),
+                *[func.sum(getattr(MessageSnapshot, field)) for field in METRIC_FIELDS]
+            )
+            .where(*window)
+            .group_by(*group_cols)
+        ).all()
+
+        # Nothing to rewrite unless some group has more than one row
+        if not any(row[2] > 1 for row in merged):
+            return
+
+        # One set-based delete of the window, then one row per group
+        self.session.exec(delete(MessageSnapshot).where(*window))
+        self._insert_snapshots([
+            {"channel_id": channel_id, "message_id": message_id, "scraped_at": scraped_at,
+             **dict(zip(METRIC_FIELDS, (int(v or 0) for v in sums)))}
+            for message_id, scraped_at, _, *sums in merged
+        ])
+
+    def get_message_growth(self, channel_id: int, message_id: int) -> List[Dict]:
+        """
+        Reconstructs the cumulative metric curve of a single message.
+        """
+        rows = self.session.exec(
+            select(MessageSnapshot)
+            .where(MessageSnapshot.channel_id == channel_id, MessageSnapshot.message_id == message_id)
+            .order_by(asc(MessageSnapshot.scraped_at))
+        ).all()
+
+        totals = dict.fromkeys(METRIC_FIELDS, 0)
+        points = []
+        for row in rows:
+            for field in METRIC_FIELDS:
+                totals[field] += getattr(row, field)
+            points.append({"timestamp": row.scraped_at, **totals})
+        return points
+
+    def get_channel_growth(self, channel_id: int, start_date: date, end_date: date, bucket: str = "day") -> List[Dict]:
+        """
+        Metrics gained per time bucket across all posts of a channel, with a running view total.
+        A message's first snapshot holds absolute values: it raises the running total
+        (baseline_views) but is not counted as a gain.
+        """
+        bucket_expr = self._time_bucket(MessageSnapshot.scraped_at, bucket)
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.max.time())
+
+        # Everything observed before the range is the starting level of the running total
+        baseline = self.session.exec(
+            select(func.coalesce(func.sum(MessageSnapshot.views), 0))
+            .where(MessageSnapshot.channel_id == channel_id, MessageSnapshot.scraped_at < start)
+        ).first() or 0
+
+        first_seen = select(
+            MessageSnapshot.message_id,
+            func.min(MessageSnapshot.scraped_at).label("first_at")
+        ).where(
+            MessageSnapshot.channel_id == channel_id
+        ).group_by(MessageSnapshot.message_id).subquery()
+        is_first = MessageSnapshot.scraped_at == first_seen.c.first_at
+
+        rows = self.session.exec(
+            select(
+                bucket_expr.label("bucket"),
+                func.sum(case((is_first, MessageSnapshot.views), else_=0)),
+                *[func.sum(case((is_first, 0), else_=getattr(MessageSnapshot, field))) for field in METRIC_FIELDS]
+            )
+            .join(first_seen, first_seen.c.message_id == MessageSnapshot.message_id)
+            .where(
+                MessageSnapshot.channel_id == channel_id,
+                MessageSnapshot.scraped_at >= start,
+                MessageSnapshot.scraped_at <= end
+            )
+            .group_by(bucket_expr)
+            .order_by(bucket_expr)
+        ).all()
+
+        cumulative_views = int(baseline)
+        points = []
+        for bucket_value, baseline_views, *sums in rows:
+            if isinstance(bucket_value, str):
+                bucket_value = datetime.fromisoformat(bucket_value)
+            gained = dict(zip(METRIC_FIELDS, (int(v or 0) for v in sums)))
+            cumulative_views += int(baseline_views or 0) + gained["views"]
+            points.append({
+                "timestamp": bucket_value,
+                **gained,
+                "baseline_views": int(baseline_views or 0),
+                "cumulative_views": cumulative_views
+            })
+        return points
+
+    def _time_bucket(self, column, bucket: str):
+        if self.session.get_bind().dialect.name == "postgresql":
+            return func.date_trunc(bucket, column)
+        # SQLite: truncate with strftime
+        fmt = "%Y-%m-%d %H:00:00" if bucket == "hour" else "%Y-%m-%d 00:00:00"
+        return func.strftime(fmt, column)
+
+    @timed_db("update_daily_stats")
+    def update_daily_stats(self, channel_id: int, days: Iterable[date]):
+        """
+        Recomputes channel_stats_daily for the given days from the posts table.
+        An album is already a single post there, so this is one grouped sum.
+        """
+        days = sorted(days)
+        if not days:
+            return
+
+        day_col = func.date(Post.date)
+        with self.session:
+            rows = self.session.exec(
+                select(
+                    day_col,
+                    func.count(Post.id),
+                    *[func.coalesce(func.sum(getattr(Post, field)), 0) for field in METRIC_FIELDS]
+                ).where(
+                    Post.channel_id == channel_id,
+                    Post.date >= datetime.combine(days[0], datetime.min.time()),
+                    Post.date <= datetime.combine(days[-1], datetime.max.time())
+                ).group_by(day_col)
+            ).all()
+
+            totals = {}
+            for day, *values in rows:
+                # SQLite returns DATE() as text
+                totals[date.fromisoformat(day) if isinstance(day, str) else day] = values
+
+            existing = {
+                stat.message_date: stat
+                for stat in self.session.exec(
+                    select(ChannelStatsDaily).where(
+                        ChannelStatsDaily.channel_id == channel_id,
+                        col(ChannelStatsDaily.message_date).in_(days)
                     )
+                ).all()
+            }
 
-                    metrics_result = self.session.exec(metrics_statement).first()
-                    views, reactions, replies, forwards = metrics_result
+            for day in days:
+                posts, views, reactions, replies, forwards = totals.get(day, (0, 0, 0, 0, 0))
+                daily_stat = existing.get(day)
+                if daily_stat is None:
+                    daily_stat = ChannelStatsDaily(channel_id=channel_id, message_date=day)
+                daily_stat.post_count = posts
+                daily_stat.total_views = views
+                daily_stat.total_reactions = reactions
+                daily_stat.total_replies = replies
+                daily_stat.total_forwards = forwards
+                self.session.add(daily_stat)
 
-                    # Update Logic
-                    daily_stat = self.session.exec(
-                        select(ChannelStatsDaily).where(
-                            ChannelStatsDaily.channel_id == channel_id,
-                            ChannelStatsDaily.message_date == day
-                        )
-                    ).first()
-
-                    if daily_stat:
-                        daily_stat.post_count = posts
-                        daily_stat.total_views = views
-                        daily_stat.total_reactions = reactions
-                        daily_stat.total_replies = replies
-                        daily_stat.total_forwards = forwards
-                        self.session.add(daily_stat)
-                    else:
-                        new_stat = ChannelStatsDaily(
-                            channel_id=channel_id,
-                            message_date=day,
-                            post_count=posts,
-                            total_views=views,
-                            total_reactions=reactions,
-                            total_replies=replies,
-                            total_forwards=forwards
-                        )
-                        self.session.add(new_stat)
-                
-                self.session.commit()
+            self.session.commit()
+        mark_written(channel_id)
 
     # ... The rest of your methods (get_last_scraped_id, update_scrape_run, etc.) remain the same ...
     def get_last_scraped_id(self, channel_id: int) -> Optional[int]:
         run = self.session.exec(select(ScrapeRun).where(ScrapeRun.channel_id == channel_id)).first()
         return run.last_scraped_id if run else None
 
+    @timed_db("update_scrape_run")
     def update_scrape_run(self, channel_id: int, last_id: int):
         with self.session:
             run = self.session.exec(select(ScrapeRun).where(ScrapeRun.channel_id == channel_id)).first()
@@ -191,6 +566,230 @@ class TelegramRepository:
             self.session.add(run)
             self.session.commit()
 
+    def get_checkpoints(self, channel_id: int, start_date: date, end_date: date) -> List[ScrapeCheckpoint]:
+        """Checkpoints whose range overlaps start_date..end_date (shard bounds move with the job's range)."""
+        return self.session.exec(select(ScrapeCheckpoint).where(
+            ScrapeCheckpoint.channel_id == channel_id,
+            ScrapeCheckpoint.range_start <= end_date,
+            ScrapeCheckpoint.range_end >= start_date
+        )).all()
+
+    def expire_checkpoints(self, channel_id: int, before: datetime) -> int:
+        """Drops checkpoints not written since before: their messages are too stale to skip."""
+        with self.session:
+            result = self.session.exec(delete(ScrapeCheckpoint).where(
+                ScrapeCheckpoint.channel_id == channel_id,
+                ScrapeCheckpoint.updated_at < before
+            ))
+            self.session.commit()
+            return result.rowcount
+
+    @timed_db("save_checkpoint")
+    def save_checkpoint(
+        self,
+        channel_id: int,
+        range_start: date,
+        range_end: date,
+        lowest_message_id: int,
+        lowest_date: datetime,
+        messages_flushed: int,
+        completed: bool = False
+    ):
+        with self.session:
+            checkpoint = self.session.get(ScrapeCheckpoint, (channel_id, range_start))
+            if checkpoint is None:
+                checkpoint = ScrapeCheckpoint(channel_id=channel_id, range_start=range_start, range_end=range_end,
+                                              lowest_message_id=lowest_message_id, lowest_date=lowest_date)
+            checkpoint.range_end = range_end
+            checkpoint.lowest_message_id = lowest_message_id
+            checkpoint.lowest_date = lowest_date
+            checkpoint.messages_flushed = messages_flushed
+            checkpoint.completed = completed
+            checkpoint.updated_at = datetime.utcnow()
+            self.session.add(checkpoint)
+            self.session.commit()
+
+    def clear_checkpoints(self, channel_id: int, start_date: date, end_date: date):
+        """Drops checkpoints of shards lying inside a range that has now been fully walked."""
+        with self.session:
+            self.session.exec(delete(ScrapeCheckpoint).where(
+                ScrapeCheckpoint.channel_id == channel_id,
+                ScrapeCheckpoint.range_start >= start_date,
+                ScrapeCheckpoint.range_end <= end_date
+            ))
+            self.session.commit()
+
+    def get_scrape_run(self, channel_id: int) -> Optional[ScrapeRun]:
+        return self.session.exec(select(ScrapeRun).where(ScrapeRun.channel_id == channel_id)).first()
+
+    def count_recent_messages(self, channel_id: int, since: datetime) -> int:
+        """
+        Returns the number of messages posted since the given time.
+        Used by the scheduler to estimate the posting rate.
+        """
+        statement = select(func.count(Message.id)).where(
+            Message.channel_id == channel_id,
+            Message.date >= since
+        )
+        return int(self.session.exec(statement).first() or 0)
+
+    def get_view_growth(self, channel_id: int, posted_since: datetime, scraped_since: datetime) -> Tuple[int, int]:
+        """
+        Returns (current views, views gained since scraped_since) over the messages
+        posted between posted_since and scraped_since that already had a snapshot
+        by then, so both numbers describe the same set of messages.
+        """
+        gained = func.sum(case((MessageSnapshot.scraped_at > scraped_since, MessageSnapshot.views), else_=0))
+        snapshots = select(
+            MessageSnapshot.message_id,
+            gained.label("gained")
+        ).where(
+            MessageSnapshot.channel_id == channel_id
+        ).group_by(
+            MessageSnapshot.message_id
+        ).having(
+            # Messages first seen after scraped_since would count their absolute views as growth
+            func.min(MessageSnapshot.scraped_at) <= scraped_since
+        ).subquery()
+
+        statement = select(
+            func.coalesce(func.sum(Message.views), 0),
+            func.coalesce(func.sum(snapshots.c.gained), 0)
+        ).join(
+            snapshots, snapshots.c.message_id == Message.message_id
+        ).where(
+            Message.channel_id == channel_id,
+            Message.date >= posted_since,
+            Message.date < scraped_since
+        )
+        views, gained_views = self.session.exec(statement).first()
+        return int(views or 0), int(gained_views or 0)
+
+    def update_refresh_schedule(
+        self,
+        channel_id: int,
+        interval_seconds: int,
+        next_scrape_at: datetime
+    ):
+        with self.session:
+            run = self.session.exec(select(ScrapeRun).where(ScrapeRun.channel_id == channel_id)).first()
+            if not run:
+                run = ScrapeRun(channel_id=channel_id)
+            run.refresh_interval_seconds = interval_seconds
+            run.next_scrape_at = next_scrape_at
+            self.session.add(run)
+            self.session.commit()
+
+    def get_due_refreshes(self, now: datetime, limit: int = 50) -> List[Tuple[ScrapeRun, Channel]]:
+        """
+        Returns scheduled runs whose next_scrape_at has passed, oldest first,
+        joined with their channel so the scheduler knows how to address them.
+        """
+        statement = select(ScrapeRun, Channel)\
+            .join(Channel, Channel.channel_id == ScrapeRun.channel_id)\
+            .where(ScrapeRun.next_scrape_at.is_not(None), ScrapeRun.next_scrape_at <= now)\
+            .order_by(asc(ScrapeRun.next_scrape_at))\
+            .limit(limit)
+        return self.session.exec(statement).all()
+
+    def get_channels_by_identifiers(self, usernames: List[str], channel_ids: List[int]) -> List[Channel]:
+        """
+        Looks up known channels by (case-insensitive) username or Telegram id in one query.
+        """
+        if not usernames and not channel_ids:
+            return []
+        conditions = []
+        if usernames:
+            conditions.append(func.lower(Channel.username).in_([u.lower() for u in usernames]))
+        if channel_ids:
+            conditions.append(col(Channel.channel_id).in_(channel_ids))
+        return self.session.exec(select(Channel).where(or_(*conditions))).all()
+
+    @timed_db("record_subscriber_count")
+    def record_subscriber_count(self, channel_id: int, subscriber_count: Optional[int], captured_at: Optional[datetime] = None) -> bool:
+        """
+        Appends a subscriber snapshot if the count differs from the latest one.
+        Returns True when a row was written.
+        """
+        if subscriber_count is None:
+            return False
+        with self.session:
+            latest = self.session.exec(
+                select(SubscriberSnapshot.subscriber_count)
+                .where(SubscriberSnapshot.channel_id == channel_id)
+                .order_by(SubscriberSnapshot.captured_at.desc())
+                .limit(1)
+            ).first()
+            if latest == subscriber_count:
+                return False
+            self.session.add(SubscriberSnapshot(
+                channel_id=channel_id,
+                captured_at=captured_at or datetime.utcnow(),
+                subscriber_count=subscriber_count
+            ))
+            self.session.commit()
+            return True
+
+    @timed_db("compact_subscriber_history")
+    def compact_subscriber_history(self, channel_id: int, now: Optional[datetime] = None):
+        """
+        Downsamples history older than SUBSCRIBER_DOWNSAMPLE_DAYS to the last count of each day.
+        """
+        cutoff = (now or datetime.utcnow()) - timedelta(days=SUBSCRIBER_DOWNSAMPLE_DAYS)
+        day_col = func.date(SubscriberSnapshot.captured_at)
+        with self.session:
+            days = self.session.exec(
+                select(func.max(SubscriberSnapshot.captured_at))
+                .where(SubscriberSnapshot.channel_id == channel_id, SubscriberSnapshot.captured_at < cutoff)
+                .group_by(day_col)
+                .having(func.count() > 1)
+            ).all()
+            for last_of_day in days:
+                self.session.exec(delete(SubscriberSnapshot).where(
+                    SubscriberSnapshot.channel_id == channel_id,
+                    func.date(SubscriberSnapshot.captured_at) == func.date(last_of_day),
+                    SubscriberSnapshot.captured_at < last_of_day
+                ))
+            self.session.commit()
+
+    def get_subscriber_history(self, channel_id: int, start_date: date, end_date: date) -> List[Dict]:
+        """
+        Daily subscriber counts (end of day, carried forward between changes) over a range.
+        """
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.max.time())
+
+        baseline = self.session.exec(
+            select(SubscriberSnapshot.subscriber_count)
+            .where(SubscriberSnapshot.channel_id == channel_id, SubscriberSnapshot.captured_at < start)
+            .order_by(SubscriberSnapshot.captured_at.desc())
+            .limit(1)
+        ).first()
+        changes = self.session.exec(
+            select(SubscriberSnapshot.captured_at, SubscriberSnapshot.subscriber_count)
+            .where(
+                SubscriberSnapshot.channel_id == channel_id,
+                SubscriberSnapshot.captured_at >= start,
+                SubscriberSnapshot.captured_at <= end
+            )
+            .order_by(asc(SubscriberSnapshot.captured_at))
+        ).all()
+
+        last_known = {}
+        for captured_at, count in changes:
+            last_known[captured_at.date()] = count
+
+        points = []
+        current = baseline
+        today = datetime.utcnow().date()
+        day = start_date
+        while day <= min(end_date, today):
+            current = last_known.get(day, current)
+            if current is not None:
+                points.append({"date": day, "subscribers": current})
+            day += timedelta(days=1)
+        return points
+
     def get_all_channels(self) -> List[Channel]:
         return self.session.exec(select(Channel)).all()
 
@@ -234,6 +833,156 @@ class TelegramRepository:
             ]
         }
 
+    def get_top_posts(
+        self,
+        channel_id: int,
+        start_date: date,
+        end_date: date,
+        metric: str = "views",
+        limit: int = 10,
+        group_media: bool = True
+    ) -> List[Dict]:
+        """
+        Top posts of a channel in a period, ranked in the database.
+        With group_media, ranking runs over the posts table: an album is one post with summed
+        interactions, and its views are the reach of the post (max_views), since every
+        item of an album shows about the same view count.
+        """
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.max.time())
+
+        # Albums are already collapsed in the posts table
+        source = Post if group_media else Message
+        items = Post.items if group_media else func.cast(1, BigInteger)
+        views = Post.max_views if group_media else Message.views
+        ranked = select(
+            source.message_id.label("message_id"),
+            source.date.label("date"),
+            items.label("items"),
+            views.label("views"),
+            *[getattr(source, field).label(field) for field in METRIC_FIELDS if field != "views"]
+        ).where(
+            source.channel_id == channel_id,
+            source.date >= start,
+            source.date <= end
+        ).subquery()
+
+        engagement_rate = (
+            func.cast(ranked.c.reactions + ranked.c.replies + ranked.c.forwards, Float)
+            / func.nullif(ranked.c.views, 0)
+        ).label("engagement_rate")
+        order = engagement_rate if metric == "engagement_rate" else ranked.c[metric]
+
+        rows = self.session.exec(
+            select(ranked, engagement_rate)
+            .order_by(order.desc().nulls_last(), ranked.c.message_id.desc())
+            .limit(limit)
+        ).all()
+
+        return [
+            {
+                "message_id": row.message_id,
+                "date": row.date,
+                "items": int(row.items),
+                **{field: int(getattr(row, field) or 0) for field in METRIC_FIELDS},
+                "engagement_rate": round(row.engagement_rate, 6) if row.engagement_rate is not None else None,
+            }
+            for row in rows
+        ]
+
+    def get_channel_comparison(self, channel_ids: Optional[List[int]], start_date: date, end_date: date) -> List[Dict]:
+        """
+        Totals, per-post averages, growth vs the previous period of equal length
+        and percentile ranks for many channels, computed in one SQL statement.
+        An empty channel_ids compares every channel with stats in the period.
+        """
+        period_days = (end_date - start_date).days + 1
+        previous_start = start_date - timedelta(days=period_days)
+        previous_end = start_date - timedelta(days=1)
+
+        def period_totals(name: str, period_start: date, period_end: date):
+            statement = select(
+                ChannelStatsDaily.channel_id.label("channel_id"),
+                func.sum(ChannelStatsDaily.post_count).label("posts"),
+                func.sum(ChannelStatsDaily.total_views).label("views"),
+                func.sum(ChannelStatsDaily.total_reactions).label("reactions"),
+                func.sum(ChannelStatsDaily.total_replies).label("replies"),
+                func.sum(ChannelStatsDaily.total_forwards).label("forwards"),
+            ).where(
+                ChannelStatsDaily.message_date >= period_start,
+                ChannelStatsDaily.message_date <= period_end
+            ).group_by(ChannelStatsDaily.channel_id)
+            if channel_ids:
+                statement = statement.where(col(ChannelStatsDaily.channel_id).in_(channel_ids))
+            return statement.cte(name)
+
+        current = period_totals("current_period", start_date, end_date)
+        previous = period_totals("previous_period", previous_start, previous_end)
+
+        def per_post(column):
+            return func.cast(column, Float) / func.nullif(current.c.posts, 0)
+
+        def growth(metric: str):
+            return (
+                func.cast(current.c[metric] - previous.c[metric], Float)
+                / func.nullif(previous.c[metric], 0)
+            )
+
+        engagement = current.c.reactions + current.c.replies + current.c.forwards
+        statement = select(
+            current.c.channel_id,
+            Channel.title,
+            Channel.username,
+            *[current.c[metric] for metric in ("posts",) + METRIC_FIELDS],
+            per_post(current.c.views).label("avg_views_per_post"),
+            per_post(engagement).label("avg_engagement_per_post"),
+            (func.cast(engagement, Float) / func.nullif(current.c.views, 0)).label("engagement_rate"),
+            previous.c.posts.label("previous_posts"),
+            previous.c.views.label("previous_views"),
+            growth("posts").label("posts_growth"),
+            growth("views").label("views_growth"),
+            func.percent_rank().over(order_by=current.c.views).label("views_percentile"),
+            func.percent_rank().over(order_by=per_post(current.c.views)).label("avg_views_percentile"),
+            func.percent_rank().over(order_by=current.c.posts).label("posts_percentile"),
+        ).select_from(
+            current
+            .outerjoin(previous, previous.c.channel_id == current.c.channel_id)
+            .outerjoin(Channel, Channel.channel_id == current.c.channel_id)
+        ).order_by(current.c.views.desc())
+
+        rows = self.session.exec(statement).all()
+
+        def as_float(value):
+            return round(float(value), 6) if value is not None else None
+
+        return [
+            {
+                "channel_id": row.channel_id,
+                "title": row.title,
+                "username": row.username,
+                **{metric: int(getattr(row, metric) or 0) for metric in ("posts",) + METRIC_FIELDS},
+                "avg_views_per_post": as_float(row.avg_views_per_post),
+                "avg_engagement_per_post": as_float(row.avg_engagement_per_post),
+                "engagement_rate": as_float(row.engagement_rate),
+                "previous_posts": int(row.previous_posts or 0),
+                "previous_views": int(row.previous_views or 0),
+                "posts_growth": as_float(row.posts_growth),
+                "views_growth": as_float(row.views_growth),
+                "views_percentile": as_float(row.views_percentile),
+                "avg_views_percentile": as_float(row.avg_views_percentile),
+                "posts_percentile": as_float(row.posts_percentile),
+            }
+            for row in rows
+        ]
+
+    def get_posts_by_channel(self, channel_id: int, limit: int = 100, offset: int = 0) -> List[Post]:
+        query = select(Post)\
+            .where(Post.channel_id == channel_id)\
+            .order_by(Post.message_id)\
+            .offset(offset)\
+            .limit(limit)
+        return self.session.exec(query).all()
+
     def get_messages_by_channel(self, channel_id: int, limit: int = 100, offset: int = 0) -> List[Message]:
         query = select(Message)\
             .where(Message.channel_id == channel_id)\
@@ -255,10 +1004,16 @@ class TelegramRepository:
             # Delete all messages for this channel
             stmt = delete(Message).where(Message.channel_id == channel.channel_id)
             self.session.exec(stmt)
+            self.session.exec(delete(MessageSnapshot).where(MessageSnapshot.channel_id == channel.channel_id))
+            self.session.exec(delete(Post).where(Post.channel_id == channel.channel_id))
+            self.session.exec(delete(SubscriberSnapshot).where(SubscriberSnapshot.channel_id == channel.channel_id))
+            self.session.exec(delete(ScrapeCheckpoint).where(ScrapeCheckpoint.channel_id == channel.channel_id))
             
             # Delete the channel
             self.session.delete(channel)
             self.session.commit()
+            mark_written(None)
+            mark_written(channel.channel_id)
             return True
         except Exception as e:
             self.session.rollback()
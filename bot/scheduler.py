@@ -0,0 +1,248 @@
+import os
+import asyncio
+import logging
+import random
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional, Set
+
+from database import get_session
+from repository import TelegramRepository
+
+logger = logging.getLogger(__name__)
+
+# --- SCHEDULER CONFIGURATION ---
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", 30))
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", 2))
+SCHEDULER_LOOKBACK_DAYS = int(os.getenv("SCHEDULER_LOOKBACK_DAYS", 7))
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", 0.1))
+
+MIN_REFRESH_SECONDS = int(os.getenv("SCHEDULER_MIN_INTERVAL", 15 * 60))          # 15 minutes
+MAX_REFRESH_SECONDS = int(os.getenv("SCHEDULER_MAX_INTERVAL", 7 * 24 * 3600))    # 1 week
+
+# Subscriber polling: get_chat only, no history walk (opt-in)
+SUBSCRIBER_POLL_ENABLED = os.getenv("SUBSCRIBER_POLL_ENABLED", "false").lower() in ("1", "true", "yes")
+SUBSCRIBER_POLL_SECONDS = int(os.getenv("SUBSCRIBER_POLL_SECONDS", 3600))
+SUBSCRIBER_POLL_CONCURRENCY = int(os.getenv("SUBSCRIBER_POLL_CONCURRENCY", 5))
+SUBSCRIBER_COMPACT_SECONDS = 24 * 3600
+
+# Refresh once the recent posts are expected to have gained this fraction of views
+TARGET_VIEW_GROWTH = 0.05
+
+
+def compute_refresh_interval(posts_per_day: float, view_growth_per_hour: float) -> int:
+    """
+    Derives a refresh interval (seconds) from channel activity.
+
+    - posts_per_day: how often new posts appear (refresh roughly once per new post)
+    - view_growth_per_hour: relative growth of views on recent posts since the last scrape
+    The shorter of both cadences wins, clamped to [MIN_REFRESH_SECONDS, MAX_REFRESH_SECONDS].
+    """
+    interval = float(MAX_REFRESH_SECONDS)
+
+    if posts_per_day > 0:
+        interval = min(interval, 86400 / posts_per_day)
+
+    if view_growth_per_hour > 0:
+        interval = min(interval, TARGET_VIEW_GROWTH / view_growth_per_hour * 3600)
+
+    return int(max(MIN_REFRESH_SECONDS, min(MAX_REFRESH_SECONDS, interval)))
+
+
+def _with_jitter(seconds: int) -> timedelta:
+    # Spread refreshes so channels scraped together do not stay in lockstep
+    factor = random.uniform(1 - SCHEDULER_JITTER, 1 + SCHEDULER_JITTER)
+    return timedelta(seconds=seconds * factor)
+
+
+def plan_next_refresh(
+    repo: TelegramRepository,
+    channel_id: int,
+    previous_scraped_at: Optional[datetime],
+    now: Optional[datetime] = None
+) -> int:
+    """
+    Stores the next refresh time for a channel right after it was scraped.
+    Returns the chosen interval in seconds.
+    """
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=SCHEDULER_LOOKBACK_DAYS)
+
+    recent_posts = repo.count_recent_messages(channel_id, since)
+
+    # View velocity: how much the posts already known at the previous scrape grew since
+    # (a moving window would count posts entering and leaving it as growth)
+    view_growth_per_hour = 0.0
+    if previous_scraped_at:
+        hours = max((now - previous_scraped_at).total_seconds() / 3600, 1 / 60)
+        views, gained = repo.get_view_growth(channel_id, since, previous_scraped_at)
+        baseline = views - gained
+        if baseline > 0 and gained > 0:
+            view_growth_per_hour = gained / baseline / hours
+
+    interval = compute_refresh_interval(recent_posts / SCHEDULER_LOOKBACK_DAYS, view_growth_per_hour)
+
+    repo.update_refresh_schedule(
+        channel_id,
+        interval_seconds=interval,
+        next_scrape_at=now + _with_jitter(interval)
+    )
+    return interval
+
+
+class ScrapeScheduler:
+    """
+    Periodically re-scrapes channels whose next_scrape_at is due.
+
+    Jobs share a global concurrency budget with manual scrapes: a scheduled
+    job is only started while fewer than SCHEDULER_CONCURRENCY scrapes run.
+    """
+
+    def __init__(self, service_factory: Callable, concurrency: int = SCHEDULER_CONCURRENCY):
+        # service_factory returns a TelegramService, or None while the client is not ready
+        self._service_factory = service_factory
+        self._concurrency = concurrency
+        self._in_flight: Set[int] = set()
+        self._jobs: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Scrape scheduler started (concurrency={self._concurrency})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for job in list(self._jobs):
+            job.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            try:
+                self._dispatch_due()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
+    def _dispatch_due(self):
+        service = self._service_factory()
+        if service is None:
+            return
+
+        free_slots = self._concurrency - service.active_job_count()
+        if free_slots <= 0:
+            return
+
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            due = TelegramRepository(session).get_due_refreshes(datetime.utcnow(), limit=free_slots * 4)
+        finally:
+            session.close()
+
+        for run, channel in due:
+            if free_slots <= 0:
+                break
+            identifier = channel.username or str(channel.channel_id)
+            if run.channel_id in self._in_flight or service.is_running(identifier):
+                continue
+
+            self._in_flight.add(run.channel_id)
+            job = asyncio.create_task(self._refresh(service, identifier, run.channel_id, run.refresh_interval_seconds))
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+            free_slots -= 1
+
+    async def _refresh(self, service, identifier: str, channel_id: int, interval: Optional[int]):
+        today = date.today()
+        try:
+            logger.info(f"Scheduled refresh for {identifier}")
+            service._update_status(identifier, status="pending", error=None)
+            await service.scrape_channel_task(identifier, today - timedelta(days=SCHEDULER_LOOKBACK_DAYS), today)
+
+            if service.status_of(identifier) == "failed":
+                # Back off so a broken channel does not burn quota every tick
+                backoff = min((interval or MIN_REFRESH_SECONDS) * 2, MAX_REFRESH_SECONDS)
+                session_gen = get_session()
+                session = next(session_gen)
+                try:
+                    TelegramRepository(session).update_refresh_schedule(
+                        channel_id,
+                        interval_seconds=backoff,
+                        next_scrape_at=datetime.utcnow() + _with_jitter(backoff)
+                    )
+                finally:
+                    session.close()
+        finally:
+            self._in_flight.discard(channel_id)
+
+
+class SubscriberPoller:
+    """
+    Records the subscriber count of every tracked channel each SUBSCRIBER_POLL_SECONDS.
+
+    A poll is a single get_chat per channel under the global rate limiter;
+    rows are only written when the count changed, and history older than
+    SUBSCRIBER_DOWNSAMPLE_DAYS is reduced to one point per day once a day.
+    """
+
+    def __init__(self, service_factory: Callable, concurrency: int = SUBSCRIBER_POLL_CONCURRENCY):
+        self._service_factory = service_factory
+        self._concurrency = concurrency
+        self._last_compaction: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Subscriber poller started (every {SUBSCRIBER_POLL_SECONDS}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Subscriber poll failed")
+            await asyncio.sleep(SUBSCRIBER_POLL_SECONDS)
+
+    async def poll_once(self):
+        service = self._service_factory()
+        if service is None:
+            return
+
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            repo = TelegramRepository(session)
+            channels = [(c.channel_id, c.username) for c in repo.get_all_channels()]
+            semaphore = asyncio.Semaphore(self._concurrency)
+            failed = 0
+
+            async def poll(channel_id: int, username: Optional[str]):
+                nonlocal failed
+                async with semaphore:
+                    try:
+                        await service.resolve_channel(repo, username or str(channel_id), force=True)
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"Subscriber poll failed for {channel_id}: {e}")
+
+            await asyncio.gather(*(poll(*c) for c in channels))
+            logger.info(f"Subscriber poll: {len(channels) - failed}/{len(channels)} channels")
+
+            now = datetime.utcnow()
+            if self._last_compaction is None or (now - self._last_compaction).total_seconds() >= SUBSCRIBER_COMPACT_SECONDS:
+                for channel_id, _ in channels:
+                    repo.compact_subscriber_history(channel_id, now)
+                self._last_compaction = now
+        finally:
+            session.close()
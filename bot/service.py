@@ -1,19 +1,173 @@
+import os
 import asyncio
 import logging
-from datetime import date
-from typing import Dict
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple, Union
 from pyrogram import Client
 from pyrogram.errors import FloodWait
 from pyrogram.enums import ChatType
 
-from models import ChannelData, MessageData, DailyMetrics
+from models import ChannelData, MessageRecord
 from database import get_session
 from repository import TelegramRepository
+from scheduler import plan_next_refresh
+import metrics
+from memory import current_rss_bytes
+from ratelimit import TELEGRAM_LIMITER, limited_history
+from channel_cache import CHANNEL_CACHE, channel_to_data, normalize_identifier
 
 logger = logging.getLogger(__name__)
 
 # --- SHARED LIVE SCRAPE STATE ---
 SCRAPE_STATUS: Dict[str, Dict] = {}
+FINISHED_STATES = ("completed", "failed")
+# Bulk scrape batches: batch_id -> batch state (see bulk_scrape_task)
+BULK_STATUS: Dict[str, Dict] = {}
+BULK_SCRAPE_CONCURRENCY = int(os.getenv("BULK_SCRAPE_CONCURRENCY", 3))
+metrics.track_scrape_queue(SCRAPE_STATUS, FINISHED_STATES)
+
+# --- INGEST BUFFERING ---
+SCRAPE_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", 50))
+# Above this RSS, shards flush early and halve their batch size (0 = no budget)
+SCRAPE_MEMORY_BUDGET_MB = int(os.getenv("SCRAPE_MEMORY_BUDGET_MB", 0))
+MEMORY_CHECK_EVERY = 100
+# Checkpoints older than this are dropped instead of resumed: the views they skip would be stale
+SCRAPE_CHECKPOINT_TTL_HOURS = float(os.getenv("SCRAPE_CHECKPOINT_TTL_HOURS", 24))
+
+
+def extract_message_data(message, channel_id: int, replies: Optional[int] = None) -> MessageRecord:
+    """
+    Builds the compact MessageRecord row for a Pyrogram message, so the message
+    object itself can be dropped right away.
+    When replies is None, the count embedded in the message is used (no extra RPC).
+    """
+    reactions = 0
+    if message.reactions and message.reactions.reactions:
+        reactions = sum(r.count for r in message.reactions.reactions)
+
+    if replies is None:
+        replies_obj = getattr(message, "replies", None)
+        replies = getattr(replies_obj, "total_count", 0) or 0
+
+    return MessageRecord(
+        channel_id=channel_id,
+        message_id=message.id,
+        date=message.date,
+        views=message.views or 0,
+        reactions=reactions,
+        replies=replies,
+        forwards=message.forwards or 0,
+        media_group_id=getattr(message, 'media_group_id', None)
+    )
+
+
+def split_date_range(start_date: date, end_date: date, shards: int) -> List[Tuple[date, date]]:
+    """
+    Splits start_date..end_date into up to `shards` contiguous ranges, newest first.
+    """
+    total_days = (end_date - start_date).days + 1
+    shards = max(1, min(shards, total_days))
+    ranges = []
+    range_end = end_date
+    for i in range(shards):
+        days = total_days // shards + (1 if i < total_days % shards else 0)
+        range_start = range_end - timedelta(days=days - 1)
+        ranges.append((range_start, range_end))
+        range_end = range_start - timedelta(days=1)
+    return ranges
+
+
+class ScrapeProgress:
+    """
+    Throughput, progress and ETA of one scrape job.
+
+    Each shard walks its date range from the newest day back to the oldest,
+    so progress is the share of all ranges already behind the shards' current
+    messages.
+    """
+    RATE_WINDOW_SECONDS = 30
+
+    def __init__(self, ranges: List[Tuple[date, date]]):
+        self.windows = [
+            (datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.max.time()))
+            for start, end in ranges
+        ]
+        self.positions: List[Optional[datetime]] = [None] * len(self.windows)
+        self.started = time.monotonic()
+        self.samples = deque()  # (monotonic time, messages processed)
+        self.flood_wait_seconds = 0.0
+        self.db_flush_seconds = 0.0
+
+    def advance(self, shard: int, current_date: datetime):
+        self.positions[shard] = current_date.replace(tzinfo=None)
+
+    def finish_shard(self, shard: int):
+        self.positions[shard] = self.windows[shard][0]
+
+    @contextmanager
+    def db_flush(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.db_flush_seconds += time.monotonic() - started
+
+    def report(self, processed: int, done: bool = False) -> Dict:
+        now = time.monotonic()
+        self.samples.append((now, processed))
+        # Keep one sample older than the window so the rate spans the whole window
+        while len(self.samples) > 2 and now - self.samples[1][0] > self.RATE_WINDOW_SECONDS:
+            self.samples.popleft()
+
+        oldest_time, oldest_count = self.samples[0]
+        rate = (processed - oldest_count) / (now - oldest_time) if now > oldest_time else 0.0
+
+        elapsed = now - self.started
+        progress = 1.0 if done else self._progress()
+        eta = None
+        if progress and progress < 1.0:
+            eta = elapsed * (1 - progress) / progress
+        elif progress == 1.0:
+            eta = 0.0
+
+        return {
+            "messages_per_second": round(rate, 2),
+            "progress": round(progress, 4) if progress is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "flood_wait_seconds": round(self.flood_wait_seconds, 1),
+            "db_flush_seconds": round(self.db_flush_seconds, 3),
+        }
+
+    def _progress(self) -> Optional[float]:
+        if all(position is None for position in self.positions):
+            return None
+        span = covered = 0.0
+        for (window_start, window_end), position in zip(self.windows, self.positions):
+            span += (window_end - window_start).total_seconds()
+            if position is not None:
+                covered += (window_end - max(window_start, min(position, window_end))).total_seconds()
+        if span <= 0:
+            return None
+        return max(0.0, min(1.0, covered / span))
+
+
+class ScrapeJob:
+    """Counters shared by the shards of one scrape job."""
+
+    def __init__(self, key: str, channel_id: int, ranges: List[Tuple[date, date]], highest_id_seen: int,
+                 resume: bool = True):
+        self.key = key
+        self.channel_id = channel_id
+        self.resume = resume
+        self.progress = ScrapeProgress(ranges)
+        self.highest_id_seen = highest_id_seen
+        self.processed_count = 0
+        # Days with scraped posts; their daily stats are recomputed at the end
+        self.days_touched: Set[date] = set()
 
 
 class TelegramService:
@@ -26,40 +180,81 @@ class TelegramService:
                 "status": "pending",
                 "messages_processed": 0,
                 "current_message_date": None,
-                "error": None
+                "error": None,
+                "rows_inserted": 0,
+                "rows_updated": 0,
+                "rows_unchanged": 0
             }
         SCRAPE_STATUS[key].update(kwargs)
 
-    async def scrape_channel_task(self, channel_identifier: str, start_date: date, end_date: date):
-        session_gen = get_session()
-        session = next(session_gen)
-        repo = TelegramRepository(session)
+    def _record_write(self, key: str, counts: Dict[str, int]):
+        # Accumulates upsert_messages outcomes for the scrape status
+        status = SCRAPE_STATUS.get(key)
+        if status is None or not counts:
+            return
+        for outcome in ("inserted", "updated", "unchanged"):
+            status[f"rows_{outcome}"] = status.get(f"rows_{outcome}", 0) + counts.get(outcome, 0)
 
-        try:
-            await self._scrape_logic(repo, channel_identifier, start_date, end_date)
-        except Exception as e:
-            logger.error(f"Background scrape failed for {channel_identifier}: {e}")
-            self._update_status(channel_identifier, status="failed", error=str(e))
-        finally:
-            session.close()
+    def status_of(self, key: str) -> Optional[str]:
+        data = SCRAPE_STATUS.get(key)
+        return data.get("status") if data else None
 
-    async def _scrape_logic(self, repo: TelegramRepository, channel_identifier: str, start_date: date, end_date: date):
-        self._update_status(channel_identifier, status="initializing")
+    def is_running(self, key: str) -> bool:
+        status = self.status_of(key)
+        return status is not None and status not in FINISHED_STATES
 
-        # --- FETCH CHAT ---
-        try:
-            chat = await self.client.get_chat(channel_identifier)
-        except Exception as e:
-            raise Exception(f"Telegram error: {e}")
+    def active_job_count(self) -> int:
+        return sum(1 for data in SCRAPE_STATUS.values() if data.get("status") not in FINISHED_STATES)
+
+    async def _fetch_replies_count(self, channel_id: int, message, job: Optional["ScrapeJob"] = None) -> Optional[int]:
+        for attempt in range(2):
+            await TELEGRAM_LIMITER.acquire()
+            try:
+                with metrics.time_rpc("get_discussion_replies_count"):
+                    return await self.client.get_discussion_replies_count(
+                        chat_id=channel_id,
+                        message_id=message.id
+                    )
+            except FloodWait as e:
+                if attempt:
+                    break
+                await self._wait_flood(job, e.value)
+            except Exception:
+                break
+        # Falls back to the count embedded in the message
+        return None
+
+    async def _wait_flood(self, job: Optional["ScrapeJob"], seconds: int):
+        # Pausing the shared limiter makes every shard and job back off together
+        logger.warning(f"FloodWait: sleeping {seconds}s")
+        TELEGRAM_LIMITER.pause(seconds)
+        metrics.FLOOD_WAIT_SECONDS.inc(seconds)
+        if job:
+            job.progress.flood_wait_seconds += seconds
+            self._update_status(job.key, status=f"paused ({seconds}s)")
+        await asyncio.sleep(seconds)
+        if job:
+            self._update_status(job.key, status="running")
+
+    async def _fetch_channel_data(self, channel_identifier) -> ChannelData:
+        for attempt in range(2):
+            await TELEGRAM_LIMITER.acquire()
+            try:
+                with metrics.time_rpc("get_chat"):
+                    chat = await self.client.get_chat(channel_identifier)
+                break
+            except FloodWait as e:
+                if attempt:
+                    raise Exception(f"Telegram error: {e}")
+                await self._wait_flood(None, e.value)
+            except Exception as e:
+                raise Exception(f"Telegram error: {e}")
 
         if chat.type not in [ChatType.CHANNEL, ChatType.SUPERGROUP]:
             raise Exception("Target is not a channel or supergroup")
 
-        channel_id = chat.id
-
-        # --- UPSERT CHANNEL META ---
-        channel_data: ChannelData = {
-            "channel_id": channel_id,
+        return {
+            "channel_id": chat.id,
             "title": chat.title,
             "username": chat.username,
             "description": chat.description,
@@ -69,122 +264,452 @@ class TelegramService:
             "linked_chat_id": getattr(chat.linked_chat, "id", None)
         }
 
-        repo.upsert_channel(channel_data)
-
-        last_id = repo.get_last_scraped_id(channel_id)
-        highest_id_seen = last_id or 0
-
-        self._update_status(channel_identifier, status="running", messages_processed=0)
-
-        messages_buffer = []
-        stats_buffer: Dict[date, DailyMetrics] = {}
-        processed_count = 0
-        BATCH_SIZE = 50
-
-        async for message in self.client.get_chat_history(channel_id):
-            try:
-                if not message.date:
-                    continue
-
-                msg_date = message.date.date()
-
-                # --- DATE BOUNDARY CONTROL ---
-                if msg_date > end_date:
-                    continue
+    async def resolve_channel(self, repo: TelegramRepository, channel_identifier: str, force: bool = False) -> ChannelData:
+        """
+        Returns channel metadata, calling get_chat only when the cache entry is
+        missing or expired (or force is set) and writing only when it changed.
+        """
+        if not force:
+            cached = CHANNEL_CACHE.get(channel_identifier)
+            if cached is not None:
+                return cached
+
+        # A previously resolved id avoids a username lookup on Telegram's side
+        channel_id = CHANNEL_CACHE.get_channel_id(channel_identifier)
+        try:
+            channel_data = await self._fetch_channel_data(channel_id or channel_identifier)
+        except Exception:
+            if channel_id is None or str(channel_id) == str(channel_identifier):
+                raise
+            # The session may not know the peer by id yet
+            channel_data = await self._fetch_channel_data(channel_identifier)
+
+        if not CHANNEL_CACHE.is_unchanged(channel_data):
+            repo.upsert_channel(channel_data)
+        # Even when the cache matches (e.g. seeded from the database): the repository skips repeats
+        repo.record_subscriber_count(channel_data["channel_id"], channel_data.get("subscriber_count"))
+        CHANNEL_CACHE.store(channel_identifier, channel_data)
+        return channel_data
+
+    async def resolve_channels(
+        self,
+        repo: TelegramRepository,
+        identifiers: List[str],
+        concurrency: int = 5
+    ) -> Dict[str, Union[ChannelData, Exception]]:
+        """
+        Resolves many identifiers at once, keyed by normalized identifier.
+        Cache hits and channels already in the database cost no RPC; only the
+        rest go to get_chat, a few at a time under the global rate limiter.
+        """
+        results: Dict[str, Union[ChannelData, Exception]] = {}
+        pending = []
+        for identifier in dict.fromkeys(normalize_identifier(i) for i in identifiers if str(i).strip()):
+            cached = CHANNEL_CACHE.get(identifier)
+            if cached is not None:
+                results[identifier] = cached
+            else:
+                pending.append(identifier)
+
+        # One query for everything the database already knows
+        if pending:
+            usernames = [i for i in pending if not i.lstrip("-").isdigit()]
+            channel_ids = [int(i) for i in pending if i.lstrip("-").isdigit()]
+            for channel in repo.get_channels_by_identifiers(usernames, channel_ids):
+                channel_data = channel_to_data(channel)
+                for key in (str(channel.channel_id), normalize_identifier(channel.username or "")):
+                    if key in pending and key not in results:
+                        CHANNEL_CACHE.store(key, channel_data)
+                        results[key] = channel_data
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(identifier: str):
+            async with semaphore:
+                try:
+                    results[identifier] = await self.resolve_channel(repo, identifier)
+                except Exception as e:
+                    results[identifier] = e
+
+        await asyncio.gather(*(fetch(i) for i in pending if i not in results))
+        return results
+
+    async def bulk_scrape_task(
+        self,
+        batch_id: str,
+        identifiers: List[str],
+        start_date: date,
+        end_date: date,
+        shards: int = 1,
+        concurrency: Optional[int] = None
+    ):
+        """
+        Resolves a batch of identifiers in one pass, then scrapes the channels
+        with at most `concurrency` jobs running at a time.
+        """
+        batch = BULK_STATUS[batch_id]
 
-                if msg_date < start_date:
-                    break
+        session_gen = get_session()
+        session = next(session_gen)
+        try:
+            resolved = await self.resolve_channels(TelegramRepository(session), identifiers)
+        except Exception as e:
+            logger.error(f"Bulk scrape {batch_id} failed to resolve channels: {e}")
+            batch.update(status="failed", error=str(e))
+            return
+        finally:
+            session.close()
 
-                # --- TRACK NEWEST MESSAGE FOR BOOKMARKING ONLY ---
-                if message.id > highest_id_seen:
-                    highest_id_seen = message.id
+        to_run = []
+        seen_channel_ids = set()
+        for identifier, result in resolved.items():
+            if isinstance(result, Exception):
+                batch["unresolved"][identifier] = str(result)
+                continue
+            # A username and a numeric id can point to the same channel
+            if result["channel_id"] in seen_channel_ids:
+                batch["duplicates"] += 1
+                continue
+            seen_channel_ids.add(result["channel_id"])
+
+            batch["channels"].append(identifier)
+            if self.is_running(identifier):
+                continue
+            self._update_status(identifier, status="pending", error=None, messages_processed=0)
+            to_run.append(identifier)
+
+        batch["status"] = "running"
+        semaphore = asyncio.Semaphore(concurrency or BULK_SCRAPE_CONCURRENCY)
+
+        async def run(identifier: str):
+            async with semaphore:
+                await self.scrape_channel_task(identifier, start_date, end_date, shards)
+
+        await asyncio.gather(*(run(identifier) for identifier in to_run))
+        batch["status"] = "completed"
+
+    async def scrape_channel_task(
+        self,
+        channel_identifier: str,
+        start_date: date,
+        end_date: date,
+        shards: int = 1,
+        resume: bool = True
+    ):
+        """
+        Scrapes a channel over a date range. With resume, shards interrupted by a
+        crash or failure continue from their checkpoint instead of the newest post.
+        """
+        session_gen = get_session()
+        session = next(session_gen)
+        repo = TelegramRepository(session)
 
-                # --- METRICS ---
-                views = message.views or 0
-                forwards = message.forwards or 0
+        started = time.perf_counter()
+        try:
+            await self._scrape_logic(repo, channel_identifier, start_date, end_date, shards, resume)
+            metrics.SCRAPE_JOBS_TOTAL.labels(outcome="completed").inc()
+        except Exception as e:
+            logger.error(f"Background scrape failed for {channel_identifier}: {e}")
+            self._update_status(channel_identifier, status="failed", error=str(e))
+            metrics.SCRAPE_JOBS_TOTAL.labels(outcome="failed").inc()
+        finally:
+            session.close()
+            elapsed = time.perf_counter() - started
+            processed = SCRAPE_STATUS.get(channel_identifier, {}).get("messages_processed", 0)
+            if processed and elapsed > 0:
+                metrics.SCRAPE_MESSAGES_PER_SECOND.observe(processed / elapsed)
+
+    async def _scrape_logic(
+        self,
+        repo: TelegramRepository,
+        channel_identifier: str,
+        start_date: date,
+        end_date: date,
+        shards: int = 1,
+        resume: bool = True
+    ):
+        self._update_status(channel_identifier, status="initializing")
 
-                reactions = 0
-                if message.reactions and message.reactions.reactions:
-                    reactions = sum(r.count for r in message.reactions.reactions)
+        # --- RESOLVE CHANNEL (cached metadata skips get_chat and the upsert) ---
+        channel_data = await self.resolve_channel(repo, channel_identifier)
+        channel_id = channel_data["channel_id"]
 
-                replies = 0
-                try:
-                    replies = await self.client.get_discussion_replies_count(
-                        chat_id=channel_id,
-                        message_id=message.id
-                    )
-                except Exception:
-                    replies_obj = getattr(message, "replies", None)
-                    replies = getattr(replies_obj, "total_count", 0)
-
-                # --- BUFFER MESSAGE ---
-                media_group_id = getattr(message, 'media_group_id', None)
-                
-                message_data: MessageData = {
-                    "channel_id": channel_id,
-                    "message_id": message.id,
-                    "date": message.date,
-                    "views": views,
-                    "reactions": reactions,
-                    "replies": replies,
-                    "forwards": forwards,
-                    "media_group_id": media_group_id
-                }
-
-                messages_buffer.append(message_data)
-
-                # --- DAILY STATS BUFFER ---
-                if msg_date not in stats_buffer:
-                    stats_buffer[msg_date] = DailyMetrics(
-                        posts=0,
-                        views=0,
-                        reactions=0,
-                        replies=0,
-                        forwards=0
-                    )
+        # Channels scraped before the posts table existed get their posts built once
+        repo.ensure_posts(channel_id)
 
-                stats = stats_buffer[msg_date]
-                # Only count as post if it's not part of a media group we've already seen
-                # This prevents counting albums (multiple photos/videos in one post) as separate posts
-                stats["posts"] += 1
-                stats["views"] += views
-                stats["reactions"] += reactions
-                stats["replies"] += replies
-                stats["forwards"] += forwards
-
-                processed_count += 1
-                if processed_count % 10 == 0:
-                    self._update_status(
-                        channel_identifier,
-                        messages_processed=processed_count,
-                        current_message_date=message.date
-                    )
+        if resume:
+            repo.expire_checkpoints(channel_id, datetime.utcnow() - timedelta(hours=SCRAPE_CHECKPOINT_TTL_HOURS))
 
-                # --- FLUSH DB BATCH ---
-                if len(messages_buffer) >= BATCH_SIZE:
-                    repo.upsert_messages(messages_buffer)
-                    repo.update_scrape_run(channel_id, highest_id_seen)
-                    messages_buffer.clear()
+        previous_run = repo.get_scrape_run(channel_id)
+        previous_scraped_at = previous_run.last_scraped_at if previous_run else None
 
-            except FloodWait as e:
-                logger.warning(f"FloodWait: sleeping {e.value}s")
-                self._update_status(channel_identifier, status=f"paused ({e.value}s)")
-                await asyncio.sleep(e.value)
-                self._update_status(channel_identifier, status="running")
+        ranges = split_date_range(start_date, end_date, shards or 1)
+        job = ScrapeJob(
+            channel_identifier,
+            channel_id,
+            ranges,
+            highest_id_seen=(previous_run.last_scraped_id if previous_run else None) or 0,
+            resume=resume
+        )
+        self._update_status(
+            channel_identifier,
+            status="running",
+            messages_processed=0,
+            rows_inserted=0,
+            rows_updated=0,
+            rows_unchanged=0,
+            shards=len(ranges),
+            **job.progress.report(0)
+        )
 
-            except Exception:
-                logger.exception(f"Error processing message {message.id}")
+        # --- WALK SHARDS CONCURRENTLY (all bounded by the global rate limiter) ---
+        shard_tasks = [
+            asyncio.create_task(self._scrape_range(repo, job, shard, range_start, range_end))
+            for shard, (range_start, range_end) in enumerate(ranges)
+        ]
+        try:
+            await asyncio.gather(*shard_tasks)
+        except BaseException:
+            # Stop the sibling shards before the job fails: they share its session and slot
+            for task in shard_tasks:
+                task.cancel()
+            await asyncio.gather(*shard_tasks, return_exceptions=True)
+            raise
 
         # --- FINAL FLUSH ---
-        if messages_buffer:
-            repo.upsert_messages(messages_buffer)
-
-        repo.update_daily_stats(channel_id, stats_buffer)
-        repo.update_scrape_run(channel_id, highest_id_seen)
+        with job.progress.db_flush():
+            repo.update_daily_stats(channel_id, job.days_touched)
+            repo.update_scrape_run(channel_id, job.highest_id_seen)
+        repo.clear_checkpoints(channel_id, start_date, end_date)
+        plan_next_refresh(repo, channel_id, previous_scraped_at)
+        repo.compact_snapshots(channel_id)
 
         self._update_status(
             channel_identifier,
             status="completed",
-            messages_processed=processed_count,
-            current_message_date=None
+            messages_processed=job.processed_count,
+            current_message_date=None,
+            **job.progress.report(job.processed_count, done=True)
         )
+
+    async def _find_offset_id(self, channel_id: int, before: date, job: Optional["ScrapeJob"] = None) -> Optional[int]:
+        """
+        Returns the offset_id that starts a history walk at the newest message
+        posted before the given day, or None when there is no older message.
+        """
+        for attempt in range(2):
+            await TELEGRAM_LIMITER.acquire()
+            try:
+                with metrics.time_rpc("get_chat_history"):
+                    async for message in self.client.get_chat_history(
+                        channel_id,
+                        limit=1,
+                        offset_date=datetime.combine(before, datetime.min.time())
+                    ):
+                        # offset_id is exclusive: the walk starts with messages older than it
+                        return message.id + 1
+                return None
+            except FloodWait as e:
+                if attempt:
+                    raise
+                await self._wait_flood(job, e.value)
+
+    async def _scrape_range(self, repo: TelegramRepository, job: ScrapeJob, shard: int, start_date: date, end_date: date):
+        channel_id = job.channel_id
+
+        # Copied out of the ORM row: it is expired by the first commit after an await
+        covered = self._checkpoint_coverage(repo, job, start_date, end_date)
+        if covered is None:
+            await self._walk_range(repo, job, shard, start_date, end_date, checkpoint_range=(start_date, end_date))
+        else:
+            covered_from, covered_to, resume_id, resume_date, flushed = covered
+            if resume_id is None:
+                logger.info(f"Shard {covered_from}..{covered_to} of {channel_id} already completed")
+            else:
+                logger.info(
+                    f"Resuming shard {start_date}..{end_date} of {channel_id} below message "
+                    f"{resume_id} ({resume_date:%Y-%m-%d})"
+                )
+            # Days flushed by the interrupted run still need their daily stats
+            day = covered_from
+            while day <= covered_to:
+                job.days_touched.add(day)
+                day += timedelta(days=1)
+
+            if covered_to < end_date:
+                # Days the checkpoint does not cover (the range grew or the shard bounds moved)
+                await self._walk_range(repo, job, shard, covered_to + timedelta(days=1), end_date)
+
+            # Everything from covered_from to end_date is stored now
+            if resume_id is not None:
+                job.progress.advance(shard, resume_date)
+                await self._walk_range(
+                    repo, job, shard, start_date, covered_to,
+                    offset_id=resume_id,
+                    checkpoint_range=(start_date, end_date),
+                    flushed=flushed
+                )
+            elif covered_from > start_date:
+                await self._walk_range(repo, job, shard, start_date, covered_from - timedelta(days=1),
+                                       checkpoint_range=(start_date, end_date))
+
+        # Kept until the whole job completes so a failure elsewhere does not redo this shard
+        repo.save_checkpoint(channel_id, start_date, end_date, 0, datetime.combine(start_date, datetime.min.time()),
+                             0, completed=True)
+        job.progress.finish_shard(shard)
+
+    @staticmethod
+    def _checkpoint_coverage(
+        repo: TelegramRepository,
+        job: ScrapeJob,
+        start_date: date,
+        end_date: date
+    ) -> Optional[Tuple[date, date, Optional[int], Optional[datetime], int]]:
+        """
+        Picks the overlapping checkpoint covering most of start_date..end_date.
+        Returns (covered_from, covered_to, resume_id, resume_date, flushed) as plain
+        values; resume_id is None when the covered days are complete, otherwise the
+        walk continues below it. None when nothing usable is stored.
+        """
+        if not job.resume:
+            return None
+
+        best = None
+        for checkpoint in repo.get_checkpoints(job.channel_id, start_date, end_date):
+            covered_to = min(checkpoint.range_end, end_date)
+            if checkpoint.completed:
+                covered_from = max(checkpoint.range_start, start_date)
+                resume_id, resume_date = None, None
+            else:
+                resume_date = checkpoint.lowest_date
+                covered_from = max(resume_date.date(), start_date)
+                resume_id = checkpoint.lowest_message_id
+                if resume_date.date() < start_date:
+                    # Walked past this shard's start: the overlap is complete
+                    resume_id, resume_date = None, None
+            if covered_from > covered_to:
+                continue
+            days = (covered_to - covered_from).days
+            if best is None or days > (best[1] - best[0]).days:
+                best = (covered_from, covered_to, resume_id, resume_date,
+                        checkpoint.messages_flushed if resume_id is not None else 0)
+        return best
+
+    async def _walk_range(
+        self,
+        repo: TelegramRepository,
+        job: ScrapeJob,
+        shard: int,
+        start_date: date,
+        end_date: date,
+        offset_id: Optional[int] = None,
+        checkpoint_range: Optional[Tuple[date, date]] = None,
+        flushed: int = 0
+    ):
+        """
+        Walks history backwards from offset_id (or the newest message of the range)
+        down to start_date. With checkpoint_range set, every flush records the
+        oldest flushed message so an interrupted walk can resume below it.
+        """
+        channel_id = job.channel_id
+
+        # Jump straight to the newest message of the range instead of skipping newer ones
+        if offset_id is None:
+            offset_id = 0
+            if end_date < date.today():
+                offset_id = await self._find_offset_id(channel_id, end_date + timedelta(days=1), job)
+                if offset_id is None:
+                    return
+
+        messages_buffer: List[MessageRecord] = []
+        batch_size = SCRAPE_BATCH_SIZE
+        lowest_id_seen = None
+
+        while True:
+            history = self.client.get_chat_history(channel_id, offset_id=offset_id)
+            try:
+                async for message in limited_history(metrics.timed_history(history), TELEGRAM_LIMITER):
+                    try:
+                        if not message.date:
+                            continue
+
+                        msg_date = message.date.date()
+                        lowest_id_seen = message.id
+
+                        # --- DATE BOUNDARY CONTROL ---
+                        if msg_date > end_date:
+                            continue
+
+                        if msg_date < start_date:
+                            break
+
+                        # --- METRICS ---
+                        replies = await self._fetch_replies_count(channel_id, message, job)
+
+                        # --- BUFFER MESSAGE (only the compact record outlives this point) ---
+                        record = extract_message_data(message, channel_id, replies)
+                        message = None
+                        messages_buffer.append(record)
+
+                        # --- TRACK NEWEST MESSAGE FOR BOOKMARKING ONLY ---
+                        if record.message_id > job.highest_id_seen:
+                            job.highest_id_seen = record.message_id
+                        job.days_touched.add(msg_date)
+
+                        job.processed_count += 1
+                        job.progress.advance(shard, record.date)
+                        metrics.SCRAPE_MESSAGES_TOTAL.inc()
+                        if job.processed_count % 10 == 0:
+                            self._update_status(
+                                job.key,
+                                messages_processed=job.processed_count,
+                                current_message_date=record.date,
+                                **job.progress.report(job.processed_count)
+                            )
+
+                        # --- MEMORY BUDGET ---
+                        over_budget = False
+                        if SCRAPE_MEMORY_BUDGET_MB and job.processed_count % MEMORY_CHECK_EVERY == 0:
+                            over_budget = current_rss_bytes() > SCRAPE_MEMORY_BUDGET_MB * 1024 * 1024
+                            if over_budget and batch_size > 1:
+                                batch_size = max(1, batch_size // 2)
+                                logger.warning(f"Memory budget exceeded, shard {shard} batch size now {batch_size}")
+
+                        # --- FLUSH DB BATCH ---
+                        if len(messages_buffer) >= batch_size or over_budget:
+                            flushed += len(messages_buffer)
+                            with job.progress.db_flush():
+                                self._record_write(job.key, repo.upsert_messages(messages_buffer))
+                                repo.update_scrape_run(channel_id, job.highest_id_seen)
+                                self._save_checkpoint(repo, job, checkpoint_range, messages_buffer[-1], flushed)
+                            messages_buffer.clear()
+
+                    except Exception:
+                        logger.exception(f"Error processing message {lowest_id_seen}")
+                break
+
+            except FloodWait as e:
+                # The history iterator cannot continue after an error:
+                # wait, then resume below the last message we saw
+                await self._wait_flood(job, e.value)
+                if lowest_id_seen is not None:
+                    offset_id = lowest_id_seen
+
+        # --- FINAL FLUSH OF THE WALK ---
+        if messages_buffer:
+            with job.progress.db_flush():
+                self._record_write(job.key, repo.upsert_messages(messages_buffer))
+
+    @staticmethod
+    def _save_checkpoint(
+        repo: TelegramRepository,
+        job: ScrapeJob,
+        checkpoint_range: Optional[Tuple[date, date]],
+        oldest: MessageRecord,
+        flushed: int
+    ):
+        # The walk is newest-first, so the last record of a flushed batch is the resume point
+        if checkpoint_range is None:
+            return
+        repo.save_checkpoint(job.channel_id, checkpoint_range[0], checkpoint_range[1],
+                             oldest.message_id, oldest.date.replace(tzinfo=None), flushed)
@@ -25,6 +25,19 @@ export interface Message {
   forwards: number
 }
 
+// /api/messages/{channel_id}?shape=columns: one array per field
+export interface MessageColumns {
+  id: number[]
+  channel_id: number[]
+  message_id: number[]
+  date: string[]
+  media_group_id: (string | null)[]
+  views: number[]
+  reactions: number[]
+  replies: number[]
+  forwards: number[]
+}
+
 // Matches Python AnalyticsResponse
 export interface DailyBreakdown {
   date: string
@@ -52,6 +65,8 @@ export interface ScrapeRequest {
   channel_identifier: string
   start_date: string
   end_date?: string
+  shards?: number
+  resume?: boolean
 }
 
 // Matches Python ScrapeStatusResponse
@@ -63,4 +78,14 @@ export interface ScrapeStatusResponse {
   messages_processed: number
   current_message_date?: string | null
   error?: string | null
+  rows_inserted?: number
+  rows_updated?: number
+  rows_unchanged?: number
+  shards?: number | null
+  messages_per_second?: number | null
+  progress?: number | null
+  eta_seconds?: number | null
+  elapsed_seconds?: number | null
+  flood_wait_seconds?: number | null
+  db_flush_seconds?: number | null
 }
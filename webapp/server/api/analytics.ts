@@ -5,7 +5,7 @@ export default defineEventHandler(async (event) => {
   const apiBase = config.public.apiBase || 'http://localhost:8000'
   
   const query = getQuery(event)
-  const { channel_id, start_date, end_date } = query
+  const { channel_id, start_date, end_date, shape } = query
 
   if (!channel_id || !start_date || !end_date) {
     throw createError({
@@ -19,7 +19,9 @@ export default defineEventHandler(async (event) => {
       params: {
         channel_id,
         start_date,
-        end_date
+        end_date,
+        // 'columns' returns daily_breakdown as one array per field
+        ...(shape ? { shape } : {})
       }
     })
     return analytics
@@ -1,4 +1,4 @@
-import type { Message } from '~/types/telegram'
+import type { Message, MessageColumns } from '~/types/telegram'
 
 export default defineEventHandler(async (event) => {
   const config = useRuntimeConfig()
@@ -8,6 +8,8 @@ export default defineEventHandler(async (event) => {
   const query = getQuery(event)
   const limit = query.limit ? Number(query.limit) : 100
   const offset = query.offset ? Number(query.offset) : 0
+  // 'columns' returns one array per field instead of one object per message
+  const shape = query.shape === 'columns' ? 'columns' : undefined
 
   if (!channelId) {
     throw createError({
@@ -17,8 +19,8 @@ export default defineEventHandler(async (event) => {
   }
 
   try {
-    const messages = await $fetch<Message[]>(`${apiBase}/api/messages/${channelId}`, {
-      params: { limit, offset }
+    const messages = await $fetch<Message[] | MessageColumns>(`${apiBase}/api/messages/${channelId}`, {
+      params: { limit, offset, ...(shape ? { shape } : {}) }
     })
     return messages
   } catch (error) {